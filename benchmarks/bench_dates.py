@@ -0,0 +1,64 @@
+"""
+Date handling of _doc2record: dateutil against the Solr date fast path on
+the four date fields of a page of Solr docs, and the resulting
+_doc2record throughput.
+
+    cd benchmarks && python bench_dates.py --page 100
+"""
+
+import argparse
+import time
+
+import dateutil.parser as dparser
+
+from pycsw.plugins.repository.solr_helper import format_datetime
+
+from common import make_doc, make_repository, write_config
+
+DATE_FIELDS = [
+    "timestamp",
+    "last_metadata_update_datetime",
+    "temporal_extent_start_date",
+    "temporal_extent_end_date",
+]
+
+
+def run(func, values, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            func(value)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--page", type=int, default=100, help="docs per page")
+    parser.add_argument("--repeat", type=int, default=100, help="timed rounds")
+    args = parser.parse_args()
+
+    docs = [make_doc("bench-%06d" % i, b"<mmd/>") for i in range(args.page)]
+    values = [doc[field][0] for doc in docs for field in DATE_FIELDS]
+
+    for value in values[: len(DATE_FIELDS)]:
+        assert format_datetime(value) == dparser.parse(value).isoformat(), value
+
+    print("%-12s %12s %12s" % ("dates", "ms/page", "dates/s"))
+    for name, func in [
+        ("dateutil", lambda value: dparser.parse(value).isoformat()),
+        ("fast", format_datetime),
+    ]:
+        elapsed = run(func, values, args.repeat)
+        print("%-12s %12.3f %12.0f" % (name, elapsed * 1000, len(values) / elapsed))
+
+    write_config("http://localhost:8983/solr/mmd")
+    repository = make_repository("http://localhost:8983/solr/mmd")
+    elapsed = run(repository._doc2record, docs, args.repeat)
+    print(
+        "%-12s %12.3f %12.0f"
+        % ("_doc2record", elapsed * 1000, len(docs) / elapsed)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Allocation and GC pressure of building a page of repository records with
+_doc2record: bytes allocated per record, GC tracked objects and time per
+page.
+
+    cd benchmarks && python bench_records.py --page 1000
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from common import make_doc, make_repository, write_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--page", type=int, default=1000, help="docs per page")
+    parser.add_argument("--repeat", type=int, default=20, help="timed rounds")
+    args = parser.parse_args()
+
+    write_config("http://localhost:8983/solr/mmd")
+    repository = make_repository("http://localhost:8983/solr/mmd")
+    docs = [make_doc("bench-%06d" % i, b"<mmd/>") for i in range(args.page)]
+    [repository._doc2record(doc) for doc in docs]
+
+    gc.collect()
+    objects = len(gc.get_objects())
+    tracemalloc.start()
+    records = [repository._doc2record(doc) for doc in docs]
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    objects = len(gc.get_objects()) - objects
+    del records
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        [repository._doc2record(doc) for doc in docs]
+    elapsed = (time.perf_counter() - start) / args.repeat
+
+    print("records:          %d" % args.page)
+    print("bytes/record:     %d" % (allocated // args.page))
+    print("GC objects/page:  %d" % objects)
+    print("ms/page:          %.1f" % (elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
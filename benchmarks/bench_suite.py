@@ -0,0 +1,216 @@
+"""
+Benchmark suite of the repository and the output schemas against a stub Solr
+replaying recorded select responses or a generated corpus: query, query_ids,
+query_domain, _doc2record and the write_record of every output schema, at 1,
+10, 100 and 1000 records per page. Results are saved as JSON and can be
+compared with the results of another version.
+
+    cd benchmarks && python bench_suite.py --recording recordings/adc.json \
+        --output results.json --compare baseline.json
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+from pycsw.plugins import outputschemas
+from pycsw.plugins.repository.solr_helper import CSW_OUTPUTSCHEMAS, ISO_OUTPUTSCHEMA
+
+from common import MMD_XSL_DIR, make_repository, read_docs, write_config
+from generate_corpus import read_corpus
+from stub_solr import StubSolr
+
+PAGE_SIZES = [1, 10, 100, 1000]
+
+
+def measure(func, repeat, setup=None):
+    """
+    Return the durations (s) of repeat runs of func, after a warm-up run.
+    With setup, func is called with the result of setup(), which is not
+    timed.
+    """
+    durations = []
+    for i in range(repeat + 1):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        func(*args)
+        if i:
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(case, size, durations):
+    median = statistics.median(durations)
+    return {
+        "case": case,
+        "page_size": size,
+        "median_ms": median * 1000,
+        "min_ms": min(durations) * 1000,
+        "per_record_ms": median * 1000 / size,
+        "records_per_s": size / median,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def cases(repository, docs, size):
+    """
+    Yield (case, func, setup) of the benchmarks at page size
+    """
+    page = docs[:size]
+    ids = [doc["metadata_identifier"] for doc in page]
+    context = repository.context
+
+    yield "query.brief", lambda: repository.query(
+        {}, maxrecords=size, outputschema=CSW_OUTPUTSCHEMAS[0], elementsetname="brief"
+    ), None
+    yield "query.iso_full", lambda: repository.query(
+        {}, maxrecords=size, outputschema=ISO_OUTPUTSCHEMA, elementsetname="full"
+    ), None
+    yield "query_ids", lambda: repository.query_ids(ids), None
+    yield "_doc2record", lambda: [repository._doc2record(doc) for doc in page], None
+
+    for name in outputschemas.__all__:
+        module = importlib.import_module("pycsw.plugins.outputschemas.%s" % name)
+
+        def write(records, module=module):
+            for record in records:
+                module.write_record(record, "full", context, "http://localhost/csw")
+
+        # fresh records for every run, so MMD documents are decoded again
+        yield "write_record.%s" % name, write, lambda: [
+            repository._doc2record(doc) for doc in page
+        ]
+
+
+def compare(results, baseline):
+    """
+    Print the median change of every case against baseline results
+    """
+    previous = {(r["case"], r["page_size"]): r for r in baseline["results"]}
+    print()
+    print("against %s" % (baseline["meta"].get("revision") or "baseline"))
+    print("%-24s %6s %12s %12s %9s" % ("case", "page", "before ms", "ms", "change"))
+    for current in results:
+        old = previous.get((current["case"], current["page_size"]))
+        if old is None or "median_ms" not in old or "median_ms" not in current:
+            continue
+        change = (current["median_ms"] / old["median_ms"] - 1) * 100
+        print(
+            "%-24s %6d %12.3f %12.3f %+8.1f%%"
+            % (
+                current["case"],
+                current["page_size"],
+                old["median_ms"],
+                current["median_ms"],
+                change,
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--recording", action="append", help="recorded select response (JSON)"
+    )
+    source.add_argument("--corpus", help="NDJSON corpus from generate_corpus.py")
+    source.add_argument("--mmd", help="MMD XML record to build docs around")
+    parser.add_argument("--xslt-dir", default=MMD_XSL_DIR, help="MMD stylesheets")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, PAGE_SIZES)),
+        help="comma separated page sizes",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    if args.recording:
+        stub = StubSolr.from_recordings(args.recording, count=max(sizes))
+    elif args.corpus:
+        stub = StubSolr(read_corpus(args.corpus, max(sizes)))
+    else:
+        stub = StubSolr(read_docs(args.mmd, max(sizes)))
+
+    results = []
+    with stub:
+        write_config(stub.url, args.xslt_dir)
+        repository = make_repository(stub.url)
+
+        print(
+            "%-24s %6s %12s %12s %12s"
+            % ("case", "page", "ms", "ms/record", "records/s")
+        )
+        for size in sizes:
+            for case, func, setup in cases(repository, stub.docs, size):
+                try:
+                    result = summarize(case, size, measure(func, args.repeat, setup))
+                except Exception as err:
+                    results.append(
+                        {"case": case, "page_size": size, "error": repr(err)}
+                    )
+                    print("%-24s %6d failed: %r" % (case, size, err))
+                    continue
+                results.append(result)
+                print(
+                    "%-24s %6d %12.3f %12.4f %12.1f"
+                    % (
+                        case,
+                        size,
+                        result["median_ms"],
+                        result["per_record_ms"],
+                        result["records_per_s"],
+                    )
+                )
+
+        # facet over all docs, independent of the page size
+        durations = measure(
+            lambda: repository.query_domain("keywords_keyword", None), args.repeat
+        )
+        results.append(summarize("query_domain", len(stub.docs), durations))
+        print(
+            "%-24s %6d %12.3f"
+            % ("query_domain", len(stub.docs), results[-1]["median_ms"])
+        )
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "repeat": args.repeat,
+            "docs": len(stub.docs),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            compare(results, json.load(fh))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Page transform throughput of SOLRMETNORepository (Solr docs to records with
+ISO XML) serially, with a thread pool and with a process pool, at 10, 100
+and 1000 records per page.
+
+    cd benchmarks && python bench_transform.py --mmd record.xml --workers 4
+"""
+
+import argparse
+import time
+
+from pycsw.plugins.repository.solr_helper import (
+    get_iso_transformer,
+    get_transform_executor,
+    render_records,
+)
+
+from common import MMD_XSL_DIR, make_repository, read_docs, write_config
+
+PAGE_SIZES = [10, 100, 1000]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mmd", required=True, help="path to an MMD XML record")
+    parser.add_argument("--xslt-dir", default=MMD_XSL_DIR, help="MMD stylesheets")
+    parser.add_argument("--workers", type=int, default=4, help="pool size")
+    args = parser.parse_args()
+
+    write_config("http://localhost:8983/solr/mmd", args.xslt_dir)
+    repository = make_repository("http://localhost:8983/solr/mmd")
+
+    executors = [
+        ("serial", None),
+        ("thread", get_transform_executor("thread", args.workers)),
+        ("process", get_transform_executor("process", args.workers)),
+    ]
+
+    print("%-8s %6s %12s %12s" % ("mode", "page", "ms/page", "records/s"))
+    for size in PAGE_SIZES:
+        docs = read_docs(args.mmd, size)
+        for name, executor in executors:
+            start = time.perf_counter()
+            if executor is None:
+                [repository._doc2record(doc, True) for doc in docs]
+            else:
+                records = [repository._doc2record(doc) for doc in docs]
+                render_records(records, get_iso_transformer(), executor=executor)
+            elapsed = time.perf_counter() - start
+            print(
+                "%-8s %6d %12.1f %12.1f"
+                % (name, size, elapsed * 1000, size / elapsed)
+            )
+
+
+if __name__ == "__main__":
+    main()
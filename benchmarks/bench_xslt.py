@@ -0,0 +1,57 @@
+"""
+Per-record XSLT transform cost: compile-per-record vs. the compiled
+stylesheet registry in solr_helper.
+
+Run from an environment where the adc-pycsw plugins are installed into
+pycsw (see README), e.g.:
+
+    python benchmarks/bench_xslt.py --xslt /usr/local/share/mmd/xslt/mmd-to-inspire.xsl \
+        --mmd record.xml --records 100
+"""
+
+import argparse
+import time
+
+from pycsw.core.etree import etree
+from pycsw.plugins.repository.solr_helper import get_xslt_transform
+
+
+def per_record_compile(xslt_file, mmd, records):
+    for _ in range(records):
+        transform = etree.XSLT(etree.parse(xslt_file))
+        transform(etree.fromstring(mmd))
+
+
+def per_record_registry(xslt_file, mmd, records):
+    for _ in range(records):
+        transform = get_xslt_transform(xslt_file)
+        transform(etree.fromstring(mmd))
+
+
+def run(func, xslt_file, mmd, records):
+    start = time.perf_counter()
+    func(xslt_file, mmd, records)
+    return (time.perf_counter() - start) / records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--xslt", required=True, help="path to the stylesheet")
+    parser.add_argument("--mmd", required=True, help="path to an MMD XML record")
+    parser.add_argument("--records", type=int, default=100, help="records per page")
+    args = parser.parse_args()
+
+    with open(args.mmd, "rb") as fh:
+        mmd = fh.read()
+
+    before = run(per_record_compile, args.xslt, mmd, args.records)
+    after = run(per_record_registry, args.xslt, mmd, args.records)
+
+    print("records per page:   %d" % args.records)
+    print("compile per record: %.3f ms/record" % (before * 1000))
+    print("compiled registry:  %.3f ms/record" % (after * 1000))
+    print("speedup:            %.1fx" % (before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Shared helpers for the benchmarks: a pycsw configuration pointing at a
+(stub) Solr core, a repository instance and Solr docs built around an MMD
+record.
+"""
+
+import base64
+import os
+import tempfile
+
+from pycsw.core.config import StaticContext
+from pycsw.plugins.repository.solr_metno import SOLRMETNORepository
+
+MMD_XSL_DIR = "/usr/local/share/mmd/xslt"
+
+XSLT = {
+    "mmd_to_iso": os.path.join(MMD_XSL_DIR, "mmd-to-inspire.xsl"),
+    "dif": os.path.join(MMD_XSL_DIR, "mmd-to-dif.xsl"),
+    "dif10": os.path.join(MMD_XSL_DIR, "mmd-to-dif10.xsl"),
+    "wmo": os.path.join(MMD_XSL_DIR, "mmd-to-wmo.xsl"),
+}
+
+
+def write_config(solr_url, xslt_dir=MMD_XSL_DIR, **repository):
+    """
+    Write a pycsw configuration for solr_url to a temporary file, point
+    PYCSW_CONFIG at it and return its path. Extra keyword arguments are
+    added to the [repository] section.
+    """
+    xslt = {name: path.replace(MMD_XSL_DIR, xslt_dir) for name, path in XSLT.items()}
+    lines = [
+        "[server]",
+        "home=%s" % os.getcwd(),
+        "url=http://localhost:8000/pycsw/csw.py",
+        "encoding=UTF-8",
+        "language=en-US",
+        "maxrecords=1000",
+        "profiles=apiso",
+        "",
+        "[manager]",
+        "transactions=false",
+        "",
+        "[repository]",
+        "database=None",
+        "source=pycsw.plugins.repository.solr_metno.SOLRMETNORepository",
+        "filter=%s" % solr_url,
+        "adc_collection=ADC,NBS",
+        "xslt_iso_transformer=mmd_to_iso",
+    ]
+    lines += ["%s=%s" % item for item in repository.items()]
+    lines += ["", "[xslt]"] + ["%s=%s" % item for item in xslt.items()]
+
+    fd, path = tempfile.mkstemp(prefix="adc-pycsw-", suffix=".cfg")
+    with os.fdopen(fd, "w") as fh:
+        fh.write("\n".join(lines) + "\n")
+    os.environ["PYCSW_CONFIG"] = path
+    return path
+
+
+def make_repository(solr_url):
+    """
+    Return a SOLRMETNORepository for solr_url
+    """
+    return SOLRMETNORepository(StaticContext(), solr_url)
+
+
+def make_doc(identifier, mmd):
+    """
+    Return a Solr doc with the fields _doc2record reads and mmd (bytes) as
+    base64 encoded MMD document
+    """
+    return {
+        "metadata_identifier": identifier,
+        "metadata_status": "Active",
+        "collection": ["ADC"],
+        "title": ["Dataset %s" % identifier],
+        "abstract": ["Abstract of dataset %s" % identifier],
+        "bbox": "ENVELOPE(-10.0,30.0,80.0,60.0)",
+        "isParent": False,
+        "timestamp": ["2022-05-04T10:11:12.123Z"],
+        "last_metadata_update_datetime": ["2022-05-01T00:00:00Z"],
+        "temporal_extent_start_date": ["2020-01-01T00:00:00Z"],
+        "temporal_extent_end_date": ["2020-12-31T00:00:00Z"],
+        "keywords_keyword": ["Sea ice", "Arctic"],
+        "iso_topic_category": ["climatologyMeteorologyAtmosphere"],
+        "personnel_investigator_name": ["Jane Doe"],
+        "data_access_url_opendap": ["https://thredds.met.no/%s.nc" % identifier],
+        "mmd_xml_file": base64.b64encode(mmd).decode("ascii"),
+    }
+
+
+def read_docs(mmd_file, count):
+    """
+    Return count Solr docs built around the MMD record in mmd_file
+    """
+    with open(mmd_file, "rb") as fh:
+        mmd = fh.read()
+    return [make_doc("bench-%06d" % i, mmd) for i in range(count)]
@@ -0,0 +1,417 @@
+"""
+Generate a synthetic corpus of MMD records as Solr docs, one JSON doc per
+line (NDJSON), for scale and load tests without a real Solr. The docs have
+the fields _doc2record reads and the base64 MMD document in mmd_xml_file.
+
+Records vary in bounding box, temporal extent, keywords, personnel, data
+access URLs and parent/child relations. The corpus is streamed, so it
+scales to any number of records, and the same seed gives the same corpus.
+
+    cd benchmarks && python generate_corpus.py --count 100000 --seed 1 \
+        --output corpus.ndjson
+"""
+
+import argparse
+import base64
+import datetime
+import json
+import random
+import sys
+import uuid
+from xml.sax.saxutils import escape, quoteattr
+
+MMD_NAMESPACE = "http://www.met.no/schema/mmd"
+
+COLLECTIONS = ["ADC", "NBS", "GCW", "SIOS", "NMDC"]
+PRODUCTION_STATUS = ["Complete", "In Work", "Planned", "Not available"]
+TOPIC_CATEGORIES = [
+    "climatologyMeteorologyAtmosphere",
+    "oceans",
+    "environment",
+    "geoscientificInformation",
+    "imageryBaseMapsEarthCover",
+    "inlandWaters",
+]
+KEYWORDS = [
+    "EARTH SCIENCE > CRYOSPHERE > SEA ICE > SEA ICE CONCENTRATION",
+    "EARTH SCIENCE > CRYOSPHERE > SEA ICE > ICE EXTENT",
+    "EARTH SCIENCE > CRYOSPHERE > SNOW/ICE > SNOW DEPTH",
+    "EARTH SCIENCE > OCEANS > OCEAN TEMPERATURE > SEA SURFACE TEMPERATURE",
+    "EARTH SCIENCE > OCEANS > SALINITY/DENSITY > SALINITY",
+    "EARTH SCIENCE > OCEANS > OCEAN WAVES > SIGNIFICANT WAVE HEIGHT",
+    "EARTH SCIENCE > ATMOSPHERE > ATMOSPHERIC TEMPERATURE > SURFACE TEMPERATURE",
+    "EARTH SCIENCE > ATMOSPHERE > ATMOSPHERIC WINDS > SURFACE WINDS",
+    "EARTH SCIENCE > ATMOSPHERE > PRECIPITATION > PRECIPITATION AMOUNT",
+    "EARTH SCIENCE > ATMOSPHERE > ATMOSPHERIC PRESSURE > SEA LEVEL PRESSURE",
+    "EARTH SCIENCE > LAND SURFACE > TOPOGRAPHY > TERRAIN ELEVATION",
+    "EARTH SCIENCE > BIOSPHERE > ECOSYSTEMS > MARINE ECOSYSTEMS",
+]
+VARIABLES = [
+    ("sea_ice_area_fraction", "sea ice concentration"),
+    ("sea_surface_temperature", "sea surface temperature"),
+    ("air_temperature", "air temperature"),
+    ("wind_speed", "wind speed"),
+    ("sea_water_salinity", "salinity"),
+    ("precipitation_amount", "precipitation"),
+    ("surface_snow_thickness", "snow depth"),
+    ("sea_surface_wave_significant_height", "significant wave height"),
+]
+REGIONS = [
+    # name, west, east, south, north
+    ("the Arctic", -180.0, 180.0, 60.0, 90.0),
+    ("the Barents Sea", 15.0, 60.0, 68.0, 82.0),
+    ("Svalbard", 5.0, 35.0, 74.0, 81.0),
+    ("the Nordic Seas", -30.0, 30.0, 60.0, 80.0),
+    ("Northern Norway", 10.0, 32.0, 65.0, 72.0),
+    ("the Fram Strait", -20.0, 15.0, 76.0, 82.0),
+    ("the globe", -180.0, 180.0, -90.0, 90.0),
+]
+SOURCES = ["model run", "satellite product", "in situ observations", "reanalysis"]
+FIRST_NAMES = ["Anna", "Ole", "Kari", "Lars", "Ingrid", "Per", "Sofie", "Erik", "Mia"]
+LAST_NAMES = ["Hansen", "Johansen", "Olsen", "Larsen", "Berg", "Dahl", "Lie", "Moe"]
+ORGANISATIONS = [
+    "Norwegian Meteorological Institute",
+    "Norwegian Polar Institute",
+    "Institute of Marine Research",
+    "University of Bergen",
+    "UiT The Arctic University of Norway",
+]
+FILE_FORMATS = ["NetCDF-CF", "NetCDF", "GRIB", "CSV"]
+LICENSES = [
+    ("CC-BY-4.0", "http://spdx.org/licenses/CC-BY-4.0"),
+    ("CC0-1.0", "http://spdx.org/licenses/CC0-1.0"),
+    ("NLOD-2.0", "http://spdx.org/licenses/NLOD-2.0"),
+]
+
+EPOCH = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def isodate(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def element(name, text, **attributes):
+    attrs = "".join(" %s=%s" % (k, quoteattr(v)) for k, v in attributes.items())
+    return "<mmd:%s%s>%s</mmd:%s>" % (name, attrs, escape(text), name)
+
+
+class CorpusGenerator(object):
+    """
+    Reproducible stream of synthetic MMD records
+    """
+
+    def __init__(self, seed=0, parent_ratio=0.05, child_ratio=0.3):
+        """
+        Initialize generator. parent_ratio of the records are parents,
+        child_ratio of the others are children of one of the last parents.
+        """
+        self.random = random.Random(seed)
+        self.parent_ratio = parent_ratio
+        self.child_ratio = child_ratio
+        self.parents = []
+
+    def identifier(self):
+        return "no.met:%s" % uuid.UUID(int=self.random.getrandbits(128), version=4)
+
+    def person(self):
+        first = self.random.choice(FIRST_NAMES)
+        last = self.random.choice(LAST_NAMES)
+        return {
+            "name": "%s %s" % (first, last),
+            "email": "%s.%s@example.org" % (first.lower(), last.lower()),
+            "organisation": self.random.choice(ORGANISATIONS),
+        }
+
+    def bbox(self):
+        name, west, east, south, north = self.random.choice(REGIONS)
+        # a random part of the region, down to a few tenths of a degree
+        width = (east - west) * self.random.uniform(0.01, 1.0)
+        height = (north - south) * self.random.uniform(0.01, 1.0)
+        west = round(self.random.uniform(west, east - width), 2)
+        south = round(self.random.uniform(south, north - height), 2)
+        return name, west, round(west + width, 2), south, round(south + height, 2)
+
+    def record(self, index):
+        """
+        Return the fields of the next record
+        """
+        rng = self.random
+        identifier = self.identifier()
+        region, west, east, south, north = self.bbox()
+        variable, variable_name = rng.choice(VARIABLES)
+        source = rng.choice(SOURCES)
+
+        start = EPOCH + datetime.timedelta(days=rng.randint(0, 3000))
+        end = None
+        if rng.random() < 0.8:
+            end = start + datetime.timedelta(days=rng.randint(1, 2000))
+        # updated after the start of the data, indexed after the update
+        updated = start + datetime.timedelta(seconds=rng.randint(0, 60000000))
+        indexed = updated + datetime.timedelta(seconds=rng.randint(0, 5000000))
+
+        is_parent = rng.random() < self.parent_ratio
+        parent = None
+        if not is_parent and self.parents and rng.random() < self.child_ratio:
+            parent = rng.choice(self.parents)
+        if is_parent:
+            self.parents = (self.parents + [identifier])[-20:]
+
+        access = {"opendap": "https://thredds.met.no/thredds/dodsC/%s/%s.nc"}
+        if rng.random() < 0.5:
+            access["ogc_wms"] = "https://thredds.met.no/thredds/wms/%s/%s.nc"
+        if rng.random() < 0.7:
+            access["http"] = "https://thredds.met.no/thredds/fileServer/%s/%s.nc"
+        if rng.random() < 0.05:
+            access["ftp"] = "ftp://ftp.met.no/projects/%s/%s.nc"
+        path = "%s/%d" % (variable, start.year)
+        access = {kind: url % (path, identifier[7:]) for kind, url in access.items()}
+
+        license_id, license_url = rng.choice(LICENSES)
+        return {
+            "identifier": identifier,
+            "index": index,
+            "title": "%s %s of %s %d"
+            % (source.capitalize(), variable_name, region, start.year),
+            "abstract": "%s of %s over %s from %s%s. Synthetic record %d."
+            % (
+                source.capitalize(),
+                variable_name,
+                region,
+                start.date().isoformat(),
+                " to %s" % end.date().isoformat() if end else ", ongoing",
+                index,
+            ),
+            "collections": rng.sample(COLLECTIONS, rng.randint(1, 2)),
+            "production_status": rng.choice(PRODUCTION_STATUS),
+            "start": start,
+            "end": end,
+            "indexed": indexed,
+            "updated": updated,
+            "bbox": (west, east, south, north),
+            "topic": rng.choice(TOPIC_CATEGORIES),
+            "keywords": rng.sample(KEYWORDS, rng.randint(1, 4)),
+            "investigators": [self.person() for _ in range(rng.randint(1, 3))],
+            "technical": [self.person() for _ in range(rng.randint(0, 2))],
+            "authors": [self.person() for _ in range(rng.randint(0, 2))],
+            "access": access,
+            "is_parent": is_parent,
+            "parent": parent,
+            "format": rng.choice(FILE_FORMATS),
+            "license": (license_id, license_url),
+            "publisher": rng.choice(ORGANISATIONS),
+            "landing_page": "https://adc.met.no/dataset/%s" % identifier[7:],
+        }
+
+    def mmd(self, record):
+        """
+        Return the MMD document of a record
+        """
+        west, east, south, north = record["bbox"]
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<mmd:mmd xmlns:mmd="%s">' % MMD_NAMESPACE,
+            element("metadata_identifier", record["identifier"]),
+            element("title", record["title"], **{"xml:lang": "en"}),
+            element("abstract", record["abstract"], **{"xml:lang": "en"}),
+            element("metadata_status", "Active"),
+            element("dataset_production_status", record["production_status"]),
+        ]
+        parts += [element("collection", c) for c in record["collections"]]
+        parts += [
+            "<mmd:last_metadata_update><mmd:update>",
+            element("datetime", isodate(record["updated"])),
+            element("type", "Created"),
+            "</mmd:update></mmd:last_metadata_update>",
+            "<mmd:temporal_extent>",
+            element("start_date", isodate(record["start"])),
+        ]
+        if record["end"] is not None:
+            parts.append(element("end_date", isodate(record["end"])))
+        parts += [
+            "</mmd:temporal_extent>",
+            '<mmd:geographic_extent><mmd:rectangle srsName="EPSG:4326">',
+            element("north", str(north)),
+            element("south", str(south)),
+            element("west", str(west)),
+            element("east", str(east)),
+            "</mmd:rectangle></mmd:geographic_extent>",
+            element("dataset_language", "en"),
+            element("operational_status", "Scientific"),
+            element("iso_topic_category", record["topic"]),
+            '<mmd:keywords vocabulary="GCMDSK">',
+        ]
+        parts += [element("keyword", k) for k in record["keywords"]]
+        parts += [
+            element(
+                "resource",
+                "https://gcmd.earthdata.nasa.gov/kms/concepts/concept_scheme/"
+                "sciencekeywords",
+            ),
+            element("separator", ">"),
+            "</mmd:keywords>",
+        ]
+        for role, people in [
+            ("Investigator", record["investigators"]),
+            ("Technical contact", record["technical"]),
+            ("Metadata author", record["authors"]),
+        ]:
+            for person in people:
+                parts += [
+                    "<mmd:personnel>",
+                    element("role", role),
+                    element("name", person["name"]),
+                    element("email", person["email"]),
+                    element("organisation", person["organisation"]),
+                    "</mmd:personnel>",
+                ]
+        parts += [
+            "<mmd:data_center><mmd:data_center_name>",
+            element("short_name", "NO/MET"),
+            element("long_name", "Norwegian Meteorological Institute"),
+            "</mmd:data_center_name>",
+            element("data_center_url", "https://met.no"),
+            "</mmd:data_center>",
+        ]
+        for kind, url in record["access"].items():
+            name = {"opendap": "OPeNDAP", "ogc_wms": "OGC WMS"}.get(kind, kind.upper())
+            parts += [
+                "<mmd:data_access>",
+                element("type", name),
+                element("description", "%s access" % name),
+                element("resource", url),
+                "</mmd:data_access>",
+            ]
+        if record["parent"] is not None:
+            parts.append(
+                element("related_dataset", record["parent"], relation_type="parent")
+            )
+        parts += [
+            "<mmd:related_information>",
+            element("type", "Dataset landing page"),
+            element("description", "Dataset landing page"),
+            element("resource", record["landing_page"]),
+            "</mmd:related_information>",
+            "<mmd:storage_information>",
+            element("file_format", record["format"]),
+            "</mmd:storage_information>",
+            "<mmd:use_constraint>",
+            element("identifier", record["license"][0]),
+            element("resource", record["license"][1]),
+            "</mmd:use_constraint>",
+            "<mmd:dataset_citation>",
+            element("author", record["investigators"][0]["name"]),
+            element("publication_date", record["updated"].date().isoformat()),
+            element("title", record["title"]),
+            element("publisher", record["publisher"]),
+            "</mmd:dataset_citation>",
+            "</mmd:mmd>",
+        ]
+        return "\n".join(parts)
+
+    def doc(self, record):
+        """
+        Return the Solr doc of a record
+        """
+        west, east, south, north = record["bbox"]
+        doc = {
+            "metadata_identifier": record["identifier"],
+            "metadata_status": "Active",
+            "collection": record["collections"],
+            "title": [record["title"]],
+            "abstract": [record["abstract"]],
+            "bbox": "ENVELOPE(%s,%s,%s,%s)" % (west, east, north, south),
+            "geographic_extent_rectangle_north": north,
+            "geographic_extent_rectangle_south": south,
+            "geographic_extent_rectangle_west": west,
+            "geographic_extent_rectangle_east": east,
+            "isParent": record["is_parent"],
+            "isChild": record["parent"] is not None,
+            "timestamp": [isodate(record["indexed"])],
+            "last_metadata_update_datetime": [isodate(record["updated"])],
+            "temporal_extent_start_date": [isodate(record["start"])],
+            "keywords_keyword": record["keywords"],
+            "iso_topic_category": [record["topic"]],
+            "dataset_language": "en",
+            "related_url_landing_page": [record["landing_page"]],
+            "personnel_investigator_name": [p["name"] for p in record["investigators"]],
+            "storage_information_file_format": record["format"],
+            "use_constraint_identifier": record["license"][0],
+            "dataset_citation_publisher": [record["publisher"]],
+        }
+        if record["end"] is not None:
+            doc["temporal_extent_end_date"] = [isodate(record["end"])]
+        if record["parent"] is not None:
+            doc["related_dataset"] = [record["parent"]]
+        if record["technical"]:
+            doc["personnel_technical_name"] = [p["name"] for p in record["technical"]]
+        if record["authors"]:
+            doc["personnel_metadata_author_name"] = [
+                p["name"] for p in record["authors"]
+            ]
+        for kind, url in record["access"].items():
+            doc["data_access_url_%s" % kind] = [url]
+
+        mmd = self.mmd(record).encode("utf-8")
+        doc["mmd_xml_file"] = base64.b64encode(mmd).decode("ascii")
+        return doc
+
+    def docs(self, count):
+        """
+        Yield count Solr docs
+        """
+        for index in range(count):
+            yield self.doc(self.record(index))
+
+
+def read_corpus(path, count=None):
+    """
+    Return the first count (default: all) docs of an NDJSON corpus
+    """
+    docs = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if count is not None and len(docs) >= count:
+                break
+            docs.append(json.loads(line))
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000, help="records")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--parent-ratio", type=float, default=0.05, help="share of parent records"
+    )
+    parser.add_argument(
+        "--child-ratio", type=float, default=0.3, help="share of child records"
+    )
+    parser.add_argument("--schema", help="MMD XML schema to validate documents with")
+    parser.add_argument("--output", help="NDJSON file (default: stdout)")
+    args = parser.parse_args()
+
+    schema = None
+    if args.schema:
+        from lxml import etree
+
+        schema = etree.XMLSchema(etree.parse(args.schema))
+
+    generator = CorpusGenerator(args.seed, args.parent_ratio, args.child_ratio)
+    out = sys.stdout
+    if args.output is not None:
+        out = open(args.output, "w", encoding="utf-8")
+    try:
+        for doc in generator.docs(args.count):
+            if schema is not None:
+                schema.assertValid(
+                    etree.fromstring(base64.b64decode(doc["mmd_xml_file"]))
+                )
+            out.write(json.dumps(doc))
+            out.write("\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+"""
+End-to-end load test of pycsw with the Solr repository plugin: replays a log
+of CSW GetRecords, GetRecordById and GetDomain requests at a given
+concurrency against worker processes serving the pycsw WSGI application,
+backed by the stub Solr. Reports throughput, latency percentiles, worker RSS
+and the share of the request time spent in Solr and in transforms, from the
+Server-Timing headers of the responses.
+
+    cd benchmarks && python load_test.py --corpus corpus.ndjson --log csw.log \
+        --workers 4 --concurrency 16 --requests 2000 --output load.json
+
+The log has one request per line: a CSW URL or KVP query string, a line of
+a web server access log (GET requests), or a JSON object with method,
+query and body for POST requests. Without --log, a mix of requests for the
+served docs is generated. With --url, the requests are sent to a running
+pycsw instead, e.g. a deployment with ServerTimingMiddleware.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import re
+import signal
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from lxml import etree
+
+from bench_suite import git_revision
+from common import MMD_XSL_DIR, read_docs, write_config
+from generate_corpus import read_corpus
+from stub_solr import StubSolr
+
+CSW_PATH = "/pycsw/csw.py"
+ACCESS_LOG = re.compile(r'"GET (\S+) HTTP/[\d.]+"')
+PERCENTILES = (50, 95, 99)
+
+# Server-Timing stages counted as time in Solr and in transforms; the
+# write_record(s) stages are not counted, they include the xslt stages
+SOLR_STAGES = ("solr.http", "solr.json")
+TRANSFORM_PREFIX = "xslt."
+
+
+class QuietHandler(WSGIRequestHandler):
+    """
+    WSGI request handler without access log
+    """
+
+    def log_message(self, *args):
+        pass
+
+
+def read_log(path):
+    """
+    Return the requests of a log as (method, query, body) tuples
+    """
+    requests = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                requests.append(
+                    (
+                        entry.get("method", "GET").upper(),
+                        entry.get("query", ""),
+                        entry.get("body"),
+                    )
+                )
+                continue
+            match = ACCESS_LOG.search(line)
+            if match is not None:
+                line = match.group(1)
+            if "?" in line or "://" in line:
+                line = urlsplit(line).query
+            requests.append(("GET", line, None))
+    return requests
+
+
+def default_log(docs, count, seed=1):
+    """
+    Return count generated GET requests for the served docs: paged brief,
+    summary and full GetRecords in the CSW and ISO schemas, GetRecordById
+    and GetDomain
+    """
+    rng = random.Random(seed)
+    base = {"service": "CSW", "version": "2.0.2"}
+    schemas = [
+        "http://www.opengis.net/cat/csw/2.0.2",
+        "http://www.isotc211.org/2005/gmd",
+    ]
+    requests = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.6:
+            params = dict(
+                base,
+                request="GetRecords",
+                typenames="csw:Record",
+                resulttype="results",
+                elementsetname=rng.choice(["brief", "summary", "full"]),
+                outputschema=rng.choice(schemas),
+                maxrecords=rng.choice([10, 10, 25, 100]),
+            )
+            params["startposition"] = rng.randrange(
+                1, max(2, len(docs) - params["maxrecords"]), params["maxrecords"]
+            )
+        elif kind < 0.9:
+            ids = rng.sample(range(len(docs)), min(len(docs), rng.choice([1, 1, 5])))
+            params = dict(
+                base,
+                request="GetRecordById",
+                id=",".join(docs[i]["metadata_identifier"] for i in ids),
+                elementsetname="full",
+                outputschema=rng.choice(schemas),
+            )
+        else:
+            params = dict(base, request="GetDomain", propertyname="dc:subject")
+        requests.append(("GET", urlencode(params), None))
+    return requests
+
+
+def request_kind(query, body):
+    """
+    Return the CSW request name of a request
+    """
+    if body:
+        try:
+            return etree.QName(etree.fromstring(body.encode("utf-8"))).localname
+        except etree.XMLSyntaxError:
+            return "invalid"
+    for key, value in parse_qsl(query):
+        if key.lower() == "request":
+            return value
+    return "unknown"
+
+
+def parse_server_timing(header):
+    """
+    Return the stage durations (ms) of a Server-Timing header by name
+    """
+    stages = {}
+    for metric in header.split(","):
+        parts = [part.strip() for part in metric.split(";")]
+        if not parts[0]:
+            continue
+        for part in parts[1:]:
+            if part.startswith("dur="):
+                stages[parts[0]] = stages.get(parts[0], 0.0) + float(part[4:])
+    return stages
+
+
+def percentile(values, p):
+    """
+    Return the p-th percentile (nearest rank) of sorted values
+    """
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100.0 * len(values)) - 1)]
+
+
+def rss(pid):
+    """
+    Return the current and peak resident set size (bytes) of process pid,
+    or None where /proc is not available
+    """
+    sizes = {}
+    try:
+        with open("/proc/%d/status" % pid) as fh:
+            for line in fh:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    sizes[key] = int(value.split()[0]) * 1024
+    except OSError:
+        return None
+    return {"rss": sizes.get("VmRSS"), "peak": sizes.get("VmHWM")}
+
+
+def serve(server):
+    """
+    Serve the pycsw WSGI application with Server-Timing headers on the
+    listening socket of server, in a forked worker process
+    """
+    from pycsw.plugins.repository.solr_trace import ServerTimingMiddleware
+    from pycsw.wsgi import application
+
+    # exit at once, without joining the threads of the repository executors
+    signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+    server.set_app(ServerTimingMiddleware(application))
+    server.serve_forever()
+
+
+def start_workers(count):
+    """
+    Start count worker processes sharing one listening socket. Returns the
+    server URL and the processes.
+    """
+    server = make_server("127.0.0.1", 0, None, handler_class=QuietHandler)
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=serve, args=(server,)) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    server.server_close()
+    return "http://127.0.0.1:%d%s" % (server.server_port, CSW_PATH), workers
+
+
+def send(url, method, query, body, timeout):
+    """
+    Send a request and return its result: kind, status, latency (s),
+    response size and stage durations
+    """
+    if query:
+        url = "%s?%s" % (url, query)
+    data = body.encode("utf-8") if body else None
+    request = urllib.request.Request(
+        url, data=data, method=method, headers={"Content-Type": "application/xml"}
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            content = response.read()
+            status = response.status
+            header = response.headers.get("Server-Timing", "")
+    except urllib.error.HTTPError as err:
+        content = err.read()
+        status = err.code
+        header = err.headers.get("Server-Timing", "")
+    except OSError as err:
+        content = b""
+        status = repr(err)
+        header = ""
+    latency = time.perf_counter() - start
+    return {
+        "kind": request_kind(query, body),
+        "status": status,
+        "latency": latency,
+        "bytes": len(content),
+        # pycsw reports exceptions with status 200
+        "exception": b"ExceptionReport" in content[:1000],
+        "stages": parse_server_timing(header),
+    }
+
+
+def replay(url, requests, total, concurrency, timeout):
+    """
+    Replay total requests, cycling through requests, from concurrency
+    clients. Returns the results and the wall time (s).
+    """
+    feed = itertools.islice(itertools.cycle(requests), total)
+    lock = threading.Lock()
+    results = []
+
+    def client():
+        while True:
+            with lock:
+                request = next(feed, None)
+            if request is None:
+                return
+            result = send(url, *request, timeout=timeout)
+            with lock:
+                results.append(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(client) for _ in range(concurrency)]:
+            future.result()
+    return results, time.perf_counter() - start
+
+
+def latency_summary(results):
+    latencies = sorted(result["latency"] * 1000 for result in results)
+    summary = {"requests": len(latencies)}
+    if latencies:
+        summary["mean_ms"] = sum(latencies) / len(latencies)
+    for p in PERCENTILES:
+        summary["p%d_ms" % p] = percentile(latencies, p)
+    return summary
+
+
+def summarize(results, elapsed):
+    """
+    Return throughput, latencies overall and per request kind, errors and
+    the time per stage of the results
+    """
+    ok = [r for r in results if r["status"] == 200 and not r["exception"]]
+    summary = dict(
+        latency_summary(results),
+        elapsed_s=elapsed,
+        throughput_rps=len(results) / elapsed if elapsed else None,
+        errors=len(results) - len(ok),
+        bytes=sum(r["bytes"] for r in results),
+    )
+
+    kinds = {}
+    for result in results:
+        kinds.setdefault(result["kind"], []).append(result)
+    summary["kinds"] = {
+        kind: latency_summary(members) for kind, members in sorted(kinds.items())
+    }
+
+    stages = {}
+    for result in results:
+        for name, duration in result["stages"].items():
+            stages[name] = stages.get(name, 0.0) + duration
+    total = sum(r["latency"] for r in results) * 1000
+    solr = sum(stages.get(name, 0.0) for name in SOLR_STAGES)
+    transform = sum(
+        duration
+        for name, duration in stages.items()
+        if name.startswith(TRANSFORM_PREFIX)
+    )
+    summary["stages_ms"] = dict(sorted(stages.items()))
+    summary["timed"] = sum(1 for r in results if r["stages"])
+    if total:
+        summary["solr_share"] = solr / total
+        summary["transform_share"] = transform / total
+        summary["other_share"] = 1 - (solr + transform) / total
+    return summary
+
+
+def report(summary, rss_sizes):
+    print(
+        "%d requests in %.2fs: %.1f requests/s, %d errors"
+        % (
+            summary["requests"],
+            summary["elapsed_s"],
+            summary["throughput_rps"],
+            summary["errors"],
+        )
+    )
+    print()
+    print(
+        "%-16s %8s %10s %10s %10s"
+        % ("request", "count", "p50 ms", "p95 ms", "p99 ms")
+    )
+    for kind, kind_summary in list(summary["kinds"].items()) + [("all", summary)]:
+        print(
+            "%-16s %8d %10.1f %10.1f %10.1f"
+            % (
+                kind,
+                kind_summary["requests"],
+                kind_summary["p50_ms"],
+                kind_summary["p95_ms"],
+                kind_summary["p99_ms"],
+            )
+        )
+
+    print()
+    if summary["timed"] and "solr_share" in summary:
+        print(
+            "time in Solr %.1f%%, in transforms %.1f%%, other %.1f%%"
+            % (
+                summary["solr_share"] * 100,
+                summary["transform_share"] * 100,
+                summary["other_share"] * 100,
+            )
+        )
+        for name, duration in summary["stages_ms"].items():
+            print("  %-32s %12.1f ms" % (name, duration))
+    else:
+        print("no Server-Timing headers, time per stage not available")
+
+    for pid, sizes in rss_sizes.items():
+        if sizes is None:
+            continue
+        print(
+            "worker %d: RSS %.1f MiB, peak %.1f MiB"
+            % (pid, sizes["rss"] / 2**20, sizes["peak"] / 2**20)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--recording", action="append", help="recorded select response (JSON)"
+    )
+    source.add_argument("--corpus", help="NDJSON corpus from generate_corpus.py")
+    source.add_argument("--mmd", help="MMD XML record to build docs around")
+    source.add_argument("--url", help="CSW endpoint of a running pycsw")
+    parser.add_argument("--log", help="CSW requests to replay")
+    parser.add_argument("--docs", type=int, default=1000, help="docs to serve")
+    parser.add_argument("--xslt-dir", default=MMD_XSL_DIR, help="MMD stylesheets")
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="[repository] configuration option of the workers",
+    )
+    parser.add_argument(
+        "--solr-delay", type=float, default=0.0, help="stub Solr delay (s)"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument(
+        "--pid", type=int, action="append", default=[], help="worker pid with --url"
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="clients")
+    parser.add_argument("--requests", type=int, help="requests (default: the log)")
+    parser.add_argument(
+        "--warmup", type=int, default=20, help="untimed requests before the run"
+    )
+    parser.add_argument("--timeout", type=float, default=60.0, help="request timeout")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    if args.url is None and not (args.recording or args.corpus or args.mmd):
+        parser.error("one of --recording, --corpus, --mmd or --url is required")
+    if args.url is None and args.log is None and args.requests is None:
+        args.requests = 1000
+
+    stub = None
+    docs = []
+    if args.recording:
+        stub = StubSolr.from_recordings(
+            args.recording, count=args.docs, delay=args.solr_delay
+        )
+    elif args.corpus:
+        stub = StubSolr(read_corpus(args.corpus, args.docs), delay=args.solr_delay)
+    elif args.mmd:
+        stub = StubSolr(read_docs(args.mmd, args.docs), delay=args.solr_delay)
+    if stub is not None:
+        docs = stub.docs
+
+    if args.log is not None:
+        requests = read_log(args.log)
+    elif docs:
+        requests = default_log(docs, args.requests)
+    else:
+        parser.error("--log is required with --url")
+    total = args.requests or len(requests)
+
+    workers = []
+    url = args.url
+    pids = list(args.pid)
+    if stub is not None:
+        options = dict(option.split("=", 1) for option in args.option)
+        write_config(stub.url, args.xslt_dir, **options)
+        # workers are forked before the stub Solr and client threads start
+        url, workers = start_workers(args.workers)
+        pids = [worker.pid for worker in workers]
+        stub.start()
+
+    try:
+        replay(url, requests, args.warmup, args.concurrency, args.timeout)
+        results, elapsed = replay(
+            url, requests, total, args.concurrency, args.timeout
+        )
+        rss_sizes = {pid: rss(pid) for pid in pids}
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        if stub is not None:
+            stub.stop()
+
+    summary = summarize(results, elapsed)
+    report(summary, rss_sizes)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(
+                {
+                    "meta": {
+                        "revision": git_revision(),
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "date": datetime.datetime.now(
+                            datetime.timezone.utc
+                        ).isoformat(),
+                        "url": args.url,
+                        "workers": len(pids),
+                        "concurrency": args.concurrency,
+                        "solr_delay": args.solr_delay,
+                        "options": args.option,
+                        "docs": len(docs),
+                    },
+                    "summary": summary,
+                    "rss": {str(pid): sizes for pid, sizes in rss_sizes.items()},
+                },
+                fh,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Record a select response of a real Solr core, with all fields including
+the base64 MMD documents, for replay by the stub Solr.
+
+    cd benchmarks && python record_solr.py --solr http://localhost:8983/solr/mmd \
+        --rows 1000 --output recordings/adc.json
+"""
+
+import argparse
+import json
+import os
+
+from pycsw.plugins.repository.solr_helper import FULL_FIELDS
+from pycsw.plugins.repository.solr_transport import SolrTransport
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--solr", required=True, help="Solr core URL")
+    parser.add_argument("--rows", type=int, default=1000, help="docs to record")
+    parser.add_argument(
+        "--fq", action="append", default=["metadata_status:Active"], help="filter"
+    )
+    parser.add_argument("--output", required=True, help="recording to write")
+    args = parser.parse_args()
+
+    params = {
+        "q": "*:*",
+        "fq": args.fq,
+        "fl": ",".join(FULL_FIELDS),
+        "rows": args.rows,
+    }
+    response = SolrTransport(args.solr).select(params)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(response, fh)
+    print(
+        "Recorded %d of %d docs to %s"
+        % (
+            len(response["response"]["docs"]),
+            response["response"]["numFound"],
+            args.output,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
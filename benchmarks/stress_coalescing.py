@@ -0,0 +1,53 @@
+"""
+Concurrent identical Solr selects against a local stub Solr, with and
+without request coalescing in the Solr transport.
+
+    python benchmarks/stress_coalescing.py --clients 50 --delay 0.2
+"""
+
+import argparse
+import threading
+import time
+
+from pycsw.plugins.repository.solr_transport import SolrTransport
+
+from stub_solr import StubSolr
+
+
+def run(url, clients, coalesce):
+    transport = SolrTransport(url, pool_size=clients, coalesce=coalesce)
+    params = {"q": "*:*", "fq": ["metadata_status:Active"], "rows": 10}
+    barrier = threading.Barrier(clients)
+
+    def client():
+        barrier.wait()
+        transport.select(params)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--delay", type=float, default=0.2, help="stub Solr delay (s)")
+    args = parser.parse_args()
+
+    docs = [{"metadata_identifier": "id-%d" % i} for i in range(100)]
+
+    for coalesce in (False, True):
+        with StubSolr(docs, delay=args.delay) as stub:
+            elapsed = run(stub.url, args.clients, coalesce)
+            print(
+                "coalesce=%-5s clients=%d upstream calls=%d elapsed=%.3fs"
+                % (coalesce, args.clients, stub.requests, elapsed)
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Local stub of a Solr core serving select requests from a list of docs,
+e.g. the docs of select responses recorded from a real Solr with
+record_solr.py.
+
+Supports q/fq/sort (ignored), start, rows, fl, cursorMark and facet.field,
+and counts the select requests it receives, so benchmarks can run without
+a real Solr.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubSolr(object):
+    """
+    Stub Solr core served from a background thread
+    """
+
+    def __init__(self, docs, delay=0.0, host="127.0.0.1", port=0):
+        """
+        Initialize stub with the docs to serve and an artificial per
+        request delay in seconds
+        """
+        self.docs = docs
+        self.delay = delay
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @classmethod
+    def from_recordings(cls, paths, count=None, **kwargs):
+        """
+        Return a stub serving the docs of recorded select responses. With
+        count, the docs are repeated with unique identifiers up to count.
+        """
+        docs = []
+        for path in paths:
+            with open(path, encoding="utf-8") as fh:
+                docs.extend(json.load(fh)["response"]["docs"])
+        if count is not None and docs:
+            recorded, docs = docs, []
+            for i in range(count):
+                doc = dict(recorded[i % len(recorded)])
+                doc["metadata_identifier"] = "%s-%d" % (doc["metadata_identifier"], i)
+                docs.append(doc)
+        return cls(docs, **kwargs)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://%s:%d/solr/mmd" % (host, port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def select(self, params):
+        """
+        Return the select response for the parsed query params
+        """
+        start = int(params.get("start", ["0"])[0])
+        rows = int(params.get("rows", ["10"])[0])
+        cursor_mark = params.get("cursorMark", [None])[0]
+        if cursor_mark is not None:
+            start = 0 if cursor_mark == "*" else int(cursor_mark)
+        fields = None
+        if "fl" in params:
+            fields = params["fl"][0].split(",")
+
+        docs = self.docs[start:start + rows]
+        if fields is not None:
+            docs = [{k: v for k, v in doc.items() if k in fields} for doc in docs]
+
+        response = {
+            "responseHeader": {"status": 0, "QTime": 0},
+            "response": {"numFound": len(self.docs), "start": start, "docs": docs},
+        }
+        if cursor_mark is not None:
+            # the mark stays the same once all docs were returned
+            response["nextCursorMark"] = str(start + len(docs)) if docs else cursor_mark
+        if params.get("facet") == ["true"]:
+            response["facet_counts"] = {
+                "facet_fields": {
+                    field: self.facet(field) for field in params.get("facet.field", [])
+                }
+            }
+        return response
+
+    def facet(self, field):
+        """
+        Return the Solr facet counts of field over all docs
+        """
+        counts = {}
+        for doc in self.docs:
+            values = doc.get(field, [])
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                counts[value] = counts.get(value, 0) + 1
+        flat = []
+        for value, count in sorted(counts.items(), key=lambda item: -item[1]):
+            flat.extend([value, count])
+        return flat
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, params):
+                with stub._lock:
+                    stub.requests += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                body = json.dumps(stub.select(params)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._respond(parse_qs(self.rfile.read(length).decode("utf-8")))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
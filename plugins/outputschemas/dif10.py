@@ -28,9 +28,9 @@
 #
 # =================================================================
 
-from pycsw.core.etree import etree
-from pycsw.plugins.repository.solr_helper import get_config_parser
-import base64
+from pycsw.plugins.repository.solr_helper import get_config_parser, transform_records
+from pycsw.plugins.repository.solr_metrics import WRITE_SECONDS
+from pycsw.plugins.repository.solr_trace import span
 
 NAMESPACE = 'http://gcmd.gsfc.nasa.gov/Aboutus/xml/dif/10/'
 NAMESPACES = {'dif': NAMESPACE}
@@ -39,13 +39,22 @@ def write_record(result, esn, context, url=None):
     ''' Return csw:SearchResults child as lxml.etree.Element '''
 
     # run lxml XSLT transformation and return against
-    # result.mmd_xml_file (which needs to base64 decoded)
+    # the MMD document of the record, decoded once per record
     # https://lxml.de/xpathxslt.html#xslt
     xslt_file = get_config_parser("xslt", "dif10")
-    transform = etree.XSLT(etree.parse(xslt_file))
-    mmd = base64.b64decode(result.mmd_xml_file)
-    doc = etree.fromstring(mmd, context.parser)
-    result_tree = transform(doc).getroot()
+    # renditions come from the rendition store when enabled
+    with span("write_record.dif10"), WRITE_SECONDS.time(schema="dif10"):
+        result_tree = transform_records([result], xslt_file, context.parser)[0]
 
-    #return etree.Element('DIF')
     return result_tree
+
+
+def write_records(results, esn, context, url=None):
+    ''' Return csw:SearchResults children of a page as lxml.etree.Element list '''
+
+    # batch variant of write_record: transforms the page concurrently,
+    # reusing the MMD trees decoded by the repository records
+    xslt_file = get_config_parser("xslt", "dif10")
+    with span("write_records.dif10", {"records": len(results)}):
+        with WRITE_SECONDS.time(schema="dif10"):
+            return transform_records(results, xslt_file, context.parser)
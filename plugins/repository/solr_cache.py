@@ -0,0 +1,337 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+LOGGER = logging.getLogger(__name__)
+
+# lock file of the rendition store held by the evicting process
+EVICT_LOCK_FILE = ".evict.lock"
+
+# process-wide caches, keyed by name
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def params_key(params):
+    """
+    Return a canonical key for a set of Solr params. Filter queries are
+    sorted since their order does not change the result.
+    """
+    normalized = dict(params)
+    if isinstance(normalized.get("fq"), list):
+        normalized["fq"] = sorted(normalized["fq"])
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+class TTLCache(object):
+    """
+    Thread-safe LRU cache whose entries expire ttl seconds after being set,
+    bounded by entry count and, optionally, by the total size in bytes of
+    its entries. A ttl of 0 disables the cache.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, maxbytes=None):
+        """
+        Initialize cache
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        # version of the data the entries were computed from
+        self.version = None
+        self.version_checked = float("-inf")
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for key, or default if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def pop(self, key, default=None):
+        """
+        Remove and return the value cached for key, or default if missing
+        or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._remove(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, size=0):
+        """
+        Cache value for key, evicting the least recently used entries.
+        Values larger than maxbytes are not cached.
+        """
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.maxsize or (
+                self.maxbytes is not None and self._bytes > self.maxbytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+    def set_version(self, version):
+        """
+        Record the current data version, dropping all entries if it changed
+        """
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self._bytes = 0
+                self.version = version
+            self.version_checked = time.monotonic()
+
+    def clear(self):
+        """
+        Drop all entries
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Return hit and miss counters and the current size of the cache
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_cache(name, maxsize=1024, ttl=60, maxbytes=None):
+    """
+    Return the process-wide cache called name, creating it on first use
+    """
+    with _CACHES_LOCK:
+        cache = _CACHES.get(name)
+        if cache is None:
+            cache = TTLCache(maxsize=maxsize, ttl=ttl, maxbytes=maxbytes)
+            _CACHES[name] = cache
+    return cache
+
+
+def cache_stats():
+    """
+    Return the stats of all process-wide caches, keyed by cache name
+    """
+    with _CACHES_LOCK:
+        caches = dict(_CACHES)
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+class _Call(object):
+    """
+    In-flight call of a SingleFlight
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Deduplicate concurrent identical calls: while a call for a key is
+    running, other callers with the same key wait for it and share its
+    result (or exception)
+    """
+
+    def __init__(self):
+        """
+        Initialize single-flight group
+        """
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) unless a call for key is already running,
+        in which case wait for it and return its result
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result
+
+
+class RenditionStore(object):
+    """
+    On-disk store of rendered records: one file per rendition under root,
+    bounded by max_size bytes with least recently used eviction. Files are
+    written atomically, so the store can be shared by worker processes.
+    Eviction scans the whole store: writers run it in a background thread
+    at most every evict_interval seconds, one process at a time.
+    """
+
+    def __init__(self, root, max_size=1024 ** 3, evict_interval=60):
+        """
+        Initialize store
+        """
+        self.root = root
+        self.max_size = max_size
+        self.evict_interval = evict_interval
+        self._evict_due = float("-inf")
+        self._evicting = False
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], "%s.xml" % key)
+
+    def get(self, key):
+        """
+        Return the rendition stored under key, or None
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except OSError:
+            return None
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """
+        Store data under key and start a background eviction when one is
+        due
+        """
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+
+        now = time.monotonic()
+        with self._lock:
+            if self._evicting or now < self._evict_due:
+                return
+            self._evicting = True
+            self._evict_due = now + self.evict_interval
+        threading.Thread(
+            target=self._evict_background, name="rendition-evict", daemon=True
+        ).start()
+
+    def _evict_background(self):
+        try:
+            self.evict()
+        except OSError as err:
+            LOGGER.warning("Rendition store eviction failed: %s", err)
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def evict(self):
+        """
+        Remove the least recently used renditions until the store is below
+        90% of max_size, unless another process is evicting. Returns the
+        size of the store in bytes, or None if eviction was skipped.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, EVICT_LOCK_FILE), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            try:
+                return self._evict()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _evict(self):
+        # sizes are read from the store, which all processes write to
+        entries = []
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_size * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+        return total
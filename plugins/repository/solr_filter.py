@@ -0,0 +1,481 @@
+"""
+Compile OGC/FES filters (as parsed by pycsw into constraint["_dict"]) into
+Solr q/fq params.
+
+Filters are first translated into a small typed intermediate representation
+(And/Or/Not over Term/Range/Spatial/FullText/IsNull/MatchNone nodes), which
+is then emitted as Solr query syntax. Literals are escaped or quoted when
+emitted; only the wildcards of PropertyIsLike patterns reach Solr as query
+syntax. Top level filter queries are planned for the Solr filterCache (see
+PlannedFilter). Compiled queries are memoized on the canonical JSON form of
+the filter.
+"""
+
+import functools
+import json
+import logging
+from collections import namedtuple
+
+from pycsw.plugins.repository.solr_helper import format_solr_date
+
+LOGGER = logging.getLogger(__name__)
+
+
+# intermediate representation
+And = namedtuple("And", ["children"])
+Or = namedtuple("Or", ["children"])
+Not = namedtuple("Not", ["child"])
+Term = namedtuple("Term", ["field", "value", "exact"])
+Range = namedtuple("Range", ["field", "lower", "upper", "include_lower", "include_upper"])
+Spatial = namedtuple("Spatial", ["field", "relation", "envelope"])
+FullText = namedtuple("FullText", ["value"])
+IsNull = namedtuple("IsNull", ["field"])
+MatchNone = namedtuple("MatchNone", [])
+# PropertyIsLike value, already escaped with its wildcards translated to * and ?
+Pattern = namedtuple("Pattern", ["text"])
+
+# compiled Solr query: q string and tuple of PlannedFilter
+SolrQuery = namedtuple("SolrQuery", ["q", "filters"])
+# filter query with its query parser local params and filterCache decision
+PlannedFilter = namedtuple(
+    "PlannedFilter", ["parser", "query", "cache", "cost", "reason"]
+)
+
+# queryable local name (lower case) -> Solr field(s)
+FIELDS = {
+    "title": ["title"],
+    "abstract": ["abstract"],
+    "subject": ["keywords_keyword"],
+    "keywords": ["keywords_keyword"],
+    "creator": ["personnel_investigator_name"],
+    "contributor": ["personnel_technical_name", "personnel_metadata_author_name"],
+    "source": ["related_url_landing_page"],
+    "format": ["storage_information_file_format"],
+    "language": ["dataset_language"],
+    "resourcelanguage": ["dataset_language"],
+    "publisher": ["dataset_citation_publisher"],
+    "organisationname": ["dataset_citation_publisher"],
+    "rights": ["use_constraint_identifier", "use_constraint_license_text"],
+    "accessconstraints": ["use_constraint_identifier", "use_constraint_license_text"],
+    "topiccategory": ["iso_topic_category"],
+    "parentidentifier": ["related_dataset"],
+    "identifier": ["metadata_identifier"],
+    "modified": ["last_metadata_update_datetime"],
+    "tempextent_begin": ["temporal_extent_start_date"],
+    "tempextent_end": ["temporal_extent_end_date"],
+}
+EXACT_FIELDS = ["metadata_identifier", "related_dataset"]
+DATE_FIELDS = [
+    "last_metadata_update_datetime",
+    "temporal_extent_start_date",
+    "temporal_extent_end_date",
+]
+
+# low cardinality fields whose filters are worth keeping in the filterCache
+CACHED_FIELDS = [
+    "isParent",
+    "iso_topic_category",
+    "dataset_language",
+    "storage_information_file_format",
+]
+# non cached filters run in order of increasing cost
+TEXT_FILTER_COST = 50
+SPATIAL_FILTER_COST = 100
+
+COMPARISONS = {
+    "PropertyIsLessThan": (None, False),
+    "PropertyIsLessThanOrEqualTo": (None, True),
+    "PropertyIsGreaterThan": (False, None),
+    "PropertyIsGreaterThanOrEqualTo": (True, None),
+}
+# characters with a meaning in the Solr standard query parser
+SPECIAL_CHARS = frozenset('\\+-!():^[]"{}~*?|&/')
+OPERATORS = ("AND", "OR", "NOT")
+
+SPATIAL_RELATIONS = {
+    # BBOX keeps the Within semantics the repository has always used
+    "BBOX": "Within",
+    "Intersects": "Intersects",
+    "Within": "Within",
+    "Contains": "Contains",
+    "Disjoint": "Disjoint",
+}
+
+
+def _local(name):
+    return name.split(":")[-1]
+
+
+def _children(node):
+    """
+    Yield (operator, operand) pairs of an xmltodict node, expanding
+    repeated operators and skipping attributes
+    """
+    for key, value in node.items():
+        if key.startswith("@") or key.startswith("#"):
+            continue
+        for operand in value if isinstance(value, list) else [value]:
+            yield _local(key), operand
+
+
+def _text(value):
+    if isinstance(value, dict):
+        value = value.get("#text")
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def _property(operand):
+    for key in ("PropertyName", "ValueReference"):
+        for name, value in _children(operand):
+            if name == key:
+                return _text(value)
+    raise NotImplementedError("Filter operand without property name: %s" % operand)
+
+
+def _literal(operand):
+    for name, value in _children(operand):
+        if name == "Literal":
+            return _text(value)
+    raise NotImplementedError("Filter operand without literal: %s" % operand)
+
+
+def _fields(name):
+    fields = FIELDS.get(_local(name).lower())
+    if fields is None:
+        raise NotImplementedError("Unsupported queryable: %s" % name)
+    return fields
+
+
+def _any(nodes):
+    return nodes[0] if len(nodes) == 1 else Or(tuple(nodes))
+
+
+def _all(nodes):
+    return nodes[0] if len(nodes) == 1 else And(tuple(nodes))
+
+
+def _value(field, value):
+    if field in DATE_FIELDS and isinstance(value, str) and value not in ("*", ""):
+        return format_solr_date(value)
+    return value
+
+
+def _escape_char(char):
+    if char in SPECIAL_CHARS or char.isspace():
+        return "\\" + char
+    return char
+
+
+def _escape_word(word):
+    # a bare AND/OR/NOT would be taken as operator
+    if word in OPERATORS:
+        return "\\" + word
+    return word
+
+
+def _escape(value):
+    """
+    Escape the query syntax in a literal. Whitespace still separates the
+    terms of the literal.
+    """
+    return " ".join(
+        _escape_word("".join(_escape_char(char) for char in word))
+        for word in value.split()
+    )
+
+
+def _like_pattern(value, operand):
+    wildcard = operand.get("@wildCard", "%")
+    single = operand.get("@singleChar", "_")
+    escape = operand.get("@escapeChar", "\\")
+
+    words = []
+    word = []
+    chars = iter(value)
+    for char in chars:
+        if char == escape:
+            word.append(_escape_char(next(chars, "")))
+        elif char == wildcard:
+            word.append("*")
+        elif char == single:
+            word.append("?")
+        elif char.isspace():
+            words.append(word)
+            word = []
+        else:
+            word.append(_escape_char(char))
+    words.append(word)
+    return Pattern(" ".join(_escape_word("".join(word)) for word in words if word))
+
+
+def _comparison(operator, operand):
+    name = _property(operand)
+    local = _local(name).lower()
+
+    if operator == "PropertyIsNull":
+        return _any([IsNull(field) for field in _fields(name)])
+
+    if operator == "PropertyIsBetween":
+        bounds = dict(_children(operand))
+        lower = _literal(bounds["LowerBoundary"])
+        upper = _literal(bounds["UpperBoundary"])
+        return _any(
+            [
+                Range(field, _value(field, lower), _value(field, upper), True, True)
+                for field in _fields(name)
+            ]
+        )
+
+    value = _literal(operand)
+
+    if operator in COMPARISONS:
+        include_lower, include_upper = COMPARISONS[operator]
+        if local in FIELDS:
+            fields = FIELDS[local]
+        elif include_lower is not None:
+            # legacy behaviour: lower bounds on unmapped properties apply
+            # to the start of the temporal extent
+            fields = ["temporal_extent_start_date"]
+        else:
+            fields = ["temporal_extent_end_date"]
+        nodes = []
+        for field in fields:
+            bound = _value(field, value)
+            if include_lower is not None:
+                nodes.append(Range(field, bound, "*", include_lower, True))
+            else:
+                nodes.append(Range(field, "*", bound, True, include_upper))
+        return _any(nodes)
+
+    if operator == "PropertyIsLike":
+        value = _like_pattern(value, operand)
+    elif operator not in ("PropertyIsEqualTo", "PropertyIsNotEqualTo"):
+        raise NotImplementedError("Unsupported filter operator: %s" % operator)
+
+    if local == "anytext":
+        node = FullText(value)
+    elif local == "type":
+        text = value.text if isinstance(value, Pattern) else value
+        if text.lower() == "dataset":
+            node = Term("isParent", "false", True)
+        elif text.lower() == "series":
+            node = Term("isParent", "true", True)
+        else:
+            node = MatchNone()
+    else:
+        node = _any(
+            [
+                Term(
+                    field,
+                    _value(field, value),
+                    field in EXACT_FIELDS or field in DATE_FIELDS,
+                )
+                for field in _fields(name)
+            ]
+        )
+
+    if operator == "PropertyIsNotEqualTo":
+        return Not(node)
+    return node
+
+
+def _spatial(operator, operand):
+    envelope = None
+    for name, value in _children(operand):
+        if name == "Envelope":
+            envelope = dict(_children(value))
+    if envelope is None:
+        raise NotImplementedError("Unsupported geometry in %s filter" % operator)
+
+    lc = [float(i) for i in _text(envelope["lowerCorner"]).split()]
+    uc = [float(i) for i in _text(envelope["upperCorner"]).split()]
+    # ENVELOPE(minX, maxX, maxY, minY)
+    return Spatial("bbox", SPATIAL_RELATIONS[operator], (lc[0], uc[0], uc[1], lc[1]))
+
+
+def parse_filter(node):
+    """
+    Translate the operators of an xmltodict filter node into the
+    intermediate representation. Sibling operators are ANDed.
+    """
+    nodes = []
+    for operator, operand in _children(node):
+        if operator == "And":
+            nodes.append(And(parse_filter(operand).children))
+        elif operator == "Or":
+            nodes.append(Or(parse_filter(operand).children))
+        elif operator == "Not":
+            nodes.append(Not(_all(parse_filter(operand).children)))
+        elif operator in SPATIAL_RELATIONS:
+            nodes.append(_spatial(operator, operand))
+        elif operator.startswith("PropertyIs"):
+            nodes.append(_comparison(operator, operand))
+        else:
+            raise NotImplementedError("Unsupported filter operator: %s" % operator)
+    return And(tuple(nodes))
+
+
+def _quote(value):
+    return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _terms(value):
+    # grouped terms of a literal or pattern, a never matching empty phrase
+    # for empty literals
+    if isinstance(value, Pattern):
+        return value.text or '""'
+    return _escape(value) or '""'
+
+
+def _bound(value):
+    return "*" if value == "*" else _quote(value)
+
+
+def _envelope(envelope):
+    return "ENVELOPE(%s)" % ",".join(str(i) for i in envelope)
+
+
+def emit(node):
+    """
+    Emit a Solr standard query parser expression for node
+    """
+    if isinstance(node, And):
+        return "(%s)" % " AND ".join(emit(child) for child in node.children)
+    if isinstance(node, Or):
+        return "(%s)" % " OR ".join(emit(child) for child in node.children)
+    if isinstance(node, Not):
+        return "(*:* -%s)" % emit(node.child)
+    if isinstance(node, Term):
+        if node.exact and not isinstance(node.value, Pattern):
+            return "%s:%s" % (node.field, _quote(node.value))
+        return "%s:(%s)" % (node.field, _terms(node.value))
+    if isinstance(node, Range):
+        return "%s:%s%s TO %s%s" % (
+            node.field,
+            "[" if node.include_lower else "{",
+            _bound(node.lower),
+            _bound(node.upper),
+            "]" if node.include_upper else "}",
+        )
+    if isinstance(node, Spatial):
+        return '%s:"%s(%s)"' % (node.field, node.relation, _envelope(node.envelope))
+    if isinstance(node, FullText):
+        return "full_text:(%s)" % _terms(node.value)
+    if isinstance(node, IsNull):
+        return "(*:* -%s:[* TO *])" % node.field
+    if isinstance(node, MatchNone):
+        return "(*:* -*:*)"
+    raise NotImplementedError("Unsupported node: %s" % (node,))
+
+
+def _has_fulltext(node):
+    if isinstance(node, FullText):
+        return True
+    if isinstance(node, (And, Or)):
+        return any(_has_fulltext(child) for child in node.children)
+    if isinstance(node, Not):
+        return _has_fulltext(node.child)
+    return False
+
+
+def _cacheable(node):
+    if isinstance(node, Term):
+        return node.field in CACHED_FIELDS
+    if isinstance(node, (And, Or)):
+        return all(_cacheable(child) for child in node.children)
+    if isinstance(node, Not):
+        return _cacheable(node.child)
+    return isinstance(node, MatchNone)
+
+
+def _plan_filter(node):
+    """
+    Decide how Solr should run the top level filter node. Filters on low
+    cardinality fields are cached; one-off spatial and text filters are
+    not, so they do not evict the long-lived entries of the filterCache.
+    """
+    if isinstance(node, Spatial):
+        # top level spatial filters keep the overlap ratio scoring
+        return PlannedFilter(
+            "field f=%s score=overlapRatio" % node.field,
+            "%s(%s)" % (node.relation, _envelope(node.envelope)),
+            False,
+            SPATIAL_FILTER_COST,
+            "spatial",
+        )
+    if _cacheable(node):
+        return PlannedFilter("", emit(node), True, None, "low cardinality")
+    return PlannedFilter("", emit(node), False, TEXT_FILTER_COST, "high cardinality")
+
+
+def constant_filter(clauses):
+    """
+    Merge the clauses every request carries (status, collection) into a
+    single cached filter
+    """
+    return PlannedFilter("", " AND ".join(clauses), True, None, "constant")
+
+
+def identifier_filter(ids):
+    """
+    One-off filter on a list of record identifiers
+    """
+    query = "metadata_identifier:(%s)" % " OR ".join(_quote(i) for i in ids)
+    return PlannedFilter("", query, False, TEXT_FILTER_COST, "identifiers")
+
+
+def render_filter(planned):
+    """
+    Render a PlannedFilter as an fq string with its local params
+    """
+    local_params = []
+    if planned.parser:
+        local_params.append(planned.parser)
+    if not planned.cache:
+        local_params.append("cache=false")
+    if planned.cost is not None:
+        local_params.append("cost=%d" % planned.cost)
+    if local_params:
+        return "{!%s}%s" % (" ".join(local_params), planned.query)
+    return planned.query
+
+
+def plan(tree):
+    """
+    Split the top level conjunction of tree into a scoring q (clauses
+    with free text) and planned filter queries (everything else)
+    """
+    q = []
+    filters = []
+    for node in tree.children:
+        if _has_fulltext(node):
+            q.append(emit(node))
+        else:
+            filters.append(_plan_filter(node))
+    return SolrQuery(" AND ".join(q) or "*:*", tuple(filters))
+
+
+@functools.lru_cache(maxsize=512)
+def _compile(canonical):
+    node = json.loads(canonical)
+    filters = [value for key, value in node.items() if _local(key) == "Filter"]
+    if not filters:
+        raise NotImplementedError("Constraint without filter: %s" % canonical)
+
+    tree = parse_filter(filters[0])
+    # a top level And is the same conjunction as sibling operators
+    while len(tree.children) == 1 and isinstance(tree.children[0], And):
+        tree = tree.children[0]
+    compiled = plan(tree)
+    LOGGER.debug("Compiled filter %s to %s", canonical, compiled)
+    return compiled
+
+
+def compile_filter(filter_dict):
+    """
+    Compile a pycsw constraint["_dict"] into a SolrQuery. Unsupported
+    filters raise NotImplementedError instead of matching everything.
+    """
+    return _compile(json.dumps(filter_dict, sort_keys=True, default=str))
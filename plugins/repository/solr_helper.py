@@ -1,15 +1,254 @@
+import base64
+import hashlib
 import os
-import configparser
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from types import MappingProxyType
+import dateutil.parser as dparser
 from pycsw import wsgi
 from pycsw.core import util
-import dateutil.parser as dparser
+from pycsw.core.etree import etree
+from pycsw.plugins.repository.solr_cache import RenditionStore
+from pycsw.plugins.repository.solr_metrics import (
+    TRANSFORM_ERRORS,
+    TRANSFORM_RECORDS,
+    TRANSFORM_SECONDS,
+)
+from pycsw.plugins.repository.solr_trace import span
 
+# compiled XSLT stylesheets of each thread, keyed by stylesheet path; the
+# entries of a thread are released with the thread
+_XSLT_REGISTRY = threading.local()
+
+# transform executors, keyed by (process id, kind, workers)
+_EXECUTORS = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+# rendition stores, keyed by (root, max size, eviction interval)
+_RENDITION_STORES = {}
+_RENDITION_STORES_LOCK = threading.Lock()
+
+# parser for MMD documents decoded outside of a pycsw context
+MMD_PARSER = etree.XMLParser(resolve_entities=False)
+
+# MMD document parser of each thread: lxml lets one thread at a time use a
+# parser, so transform threads sharing the pycsw parser would parse serially
+_MMD_PARSERS = threading.local()
+
+# parent list passed to the MMD stylesheets
+PARENT_LIST = "/usr/local/share/parent_list.xml"
+
+# seconds between checks of the configuration file mtime
+CONFIG_CHECK_INTERVAL = 5
+
+ConfigSnapshot = namedtuple(
+    "ConfigSnapshot",
+    ["path", "mtime", "config", "collection_filter", "xslt", "iso_transformer"],
+)
+
+_CONFIG_SNAPSHOT = None
+_CONFIG_CHECKED = 0
+_CONFIG_LOCK = threading.Lock()
+
+# flattened queryables, keyed by the typenames of the pycsw model
+_QUERYABLES = {}
+
+
+def _load_config_snapshot(configuration_path, mtime):
+    config = util.parse_ini_config(configuration_path)
+
+    collection_filter = config.get("repository", "adc_collection", fallback="")
+    xslt = {}
+    if config.has_section("xslt"):
+        xslt = dict(config.items("xslt"))
+    mmd_to_iso = config.get("repository", "xslt_iso_transformer", fallback=None)
+
+    return ConfigSnapshot(
+        path=configuration_path,
+        mtime=mtime,
+        config=config,
+        collection_filter=collection_filter.replace(",", " "),
+        xslt=MappingProxyType(xslt),
+        iso_transformer=xslt.get(mmd_to_iso),
+    )
+
+
+# Solr fields read by SOLRMETNORepository._doc2record, by csw:Record element set
+BRIEF_FIELDS = ["metadata_identifier", "title", "bbox", "isParent"]
+SUMMARY_FIELDS = BRIEF_FIELDS + [
+    "abstract",
+    "iso_topic_category",
+    "keywords_keyword",
+    "isChild",
+    "related_dataset",
+    "storage_information_file_format",
+    "last_metadata_update_datetime",
+    "timestamp",
+]
+RECORD_FIELDS = SUMMARY_FIELDS + [
+    "related_url_landing_page",
+    "dataset_language",
+    "temporal_extent_start_date",
+    "temporal_extent_end_date",
+    "data_access_url_opendap",
+    "data_access_url_ogc_wms",
+    "data_access_url_http",
+    "data_access_url_ftp",
+    "personnel_investigator_name",
+    "personnel_technical_name",
+    "personnel_metadata_author_name",
+    "use_constraint_license_text",
+    "use_constraint_identifier",
+    "dataset_citation_publisher",
+]
+FULL_FIELDS = RECORD_FIELDS + ["mmd_xml_file"]
+
+CSW_OUTPUTSCHEMAS = [
+    "http://www.opengis.net/cat/csw/2.0.2",
+    "http://www.opengis.net/cat/csw/3.0",
+]
+ISO_OUTPUTSCHEMA = "http://www.isotc211.org/2005/gmd"
+# output schemas built from record fields rather than from the MMD document
+FIELD_OUTPUTSCHEMAS = [
+    "http://www.w3.org/2005/Atom",
+    "http://www.opengis.net/cat/csw/csdgm",
+    "http://www.interlis.ch/INTERLIS2.3",
+]
+
+
+# date format of Solr date fields and filter literals
+SOLR_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _parse_solr_date(value):
+    # YYYY-MM-DDThh:mm:ss[.f+]Z as returned by Solr, None for other forms
+    if (
+        len(value) < 20
+        or value[-1] != "Z"
+        or value[4] != "-"
+        or value[7] != "-"
+        or value[10] != "T"
+        or value[13] != ":"
+        or value[16] != ":"
+    ):
+        return None
+    microsecond = 0
+    if len(value) > 20:
+        fraction = value[20:-1]
+        if value[19] != "." or not fraction.isdigit():
+            return None
+        microsecond = int(fraction[:6].ljust(6, "0"))
+    try:
+        return datetime(
+            int(value[0:4]),
+            int(value[5:7]),
+            int(value[8:10]),
+            int(value[11:13]),
+            int(value[14:16]),
+            int(value[17:19]),
+            microsecond,
+            timezone.utc,
+        )
+    except ValueError:
+        return None
+
+
+def parse_datetime(value):
+    """
+    Parse an ISO 8601 date or datetime string. Solr dates are parsed
+    directly, any other form (e.g. client filter literals) by dateutil.
+    """
+    parsed = _parse_solr_date(value)
+    if parsed is None:
+        parsed = dparser.parse(value)
+    return parsed
 
-def get_config():
-    pycsw_root = wsgi.get_pycsw_root_path(os.environ, os.environ)
-    configuration_path = wsgi.get_configuration_path(os.environ, os.environ, pycsw_root)
 
-    return util.parse_ini_config(configuration_path)
+def format_datetime(value):
+    """
+    Return a date string, e.g. a Solr date, in isoformat()
+    """
+    return parse_datetime(value).isoformat()
+
+
+def format_solr_date(value):
+    """
+    Return a date string as Solr date literal in UTC. Dates without
+    timezone are taken as UTC.
+    """
+    parsed = parse_datetime(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime(SOLR_DATE_FORMAT)
+
+
+def get_timestamp(doc):
+    """
+    Return the index timestamp of a Solr doc, or None if it has none. The
+    field is single valued or a list, depending on the Solr schema.
+    """
+    timestamp = doc.get("timestamp")
+    if isinstance(timestamp, list):
+        timestamp = timestamp[0] if timestamp else None
+    return timestamp
+
+
+def get_field_list(outputschema=None, elementsetname=None):
+    """
+    Return the Solr fields needed to serialize records in outputschema with
+    elementsetname. Only ISO full and the XSLT-backed outputs (DIF, DIF10,
+    WMO) need the MMD document.
+    """
+    if outputschema in CSW_OUTPUTSCHEMAS:
+        if elementsetname == "brief":
+            return BRIEF_FIELDS
+        if elementsetname == "summary":
+            return SUMMARY_FIELDS
+        return RECORD_FIELDS
+    if outputschema == ISO_OUTPUTSCHEMA and elementsetname != "full":
+        return RECORD_FIELDS
+    if outputschema in FIELD_OUTPUTSCHEMAS:
+        return RECORD_FIELDS
+    return FULL_FIELDS
+
+
+def get_config_snapshot():
+    """
+    Return the process-wide configuration snapshot. The configuration file
+    is parsed once and reloaded only when its mtime changes; the mtime is
+    checked at most every CONFIG_CHECK_INTERVAL seconds.
+    """
+    global _CONFIG_SNAPSHOT, _CONFIG_CHECKED
+
+    now = time.monotonic()
+    snapshot = _CONFIG_SNAPSHOT
+    if snapshot is not None and now - _CONFIG_CHECKED < CONFIG_CHECK_INTERVAL:
+        return snapshot
+
+    with _CONFIG_LOCK:
+        pycsw_root = wsgi.get_pycsw_root_path(os.environ, os.environ)
+        configuration_path = wsgi.get_configuration_path(
+            os.environ, os.environ, pycsw_root
+        )
+        mtime = os.stat(configuration_path).st_mtime_ns
+        snapshot = _CONFIG_SNAPSHOT
+        if (
+            snapshot is None
+            or snapshot.path != configuration_path
+            or snapshot.mtime != mtime
+        ):
+            snapshot = _load_config_snapshot(configuration_path, mtime)
+            _CONFIG_SNAPSHOT = snapshot
+        _CONFIG_CHECKED = now
+
+    return snapshot
+
+
+def get_config():
+    return get_config_snapshot().config
 
 
 def get_config_parser(section, entry):
@@ -17,305 +256,276 @@ def get_config_parser(section, entry):
 
 
 def get_iso_transformer():
-    mmd_to_iso = get_config_parser("repository", "xslt_iso_transformer")
-    return get_config_parser("xslt", mmd_to_iso)
-
+    iso_transformer = get_config_snapshot().iso_transformer
+    if iso_transformer is None:
+        mmd_to_iso = get_config_parser("repository", "xslt_iso_transformer")
+        return get_config_parser("xslt", mmd_to_iso)
+    return iso_transformer
 
 
 def get_collection_filter():
-    pycsw_root = wsgi.get_pycsw_root_path(os.environ, os.environ)
-    configuration_path = wsgi.get_configuration_path(os.environ, os.environ, pycsw_root)
-
-    config = configparser.ConfigParser(interpolation=util.EnvInterpolation())
-
-    with open(configuration_path, encoding="utf-8") as scp:
-        config.read_file(scp)
-        collection_filter = config.get("repository", "adc_collection")
-    return collection_filter.replace(",", " ")
-
-
-def parse_bbox_OR_query(constraint, right_hand_envelope=False):
-    if "ogc:BBOX" in constraint:
-        print("Got bbox filter query")
-        lc = constraint["ogc:BBOX"]["gml:Envelope"]["gml:lowerCorner"].strip().split()
-        uc = constraint["ogc:BBOX"]["gml:Envelope"]["gml:upperCorner"].strip().split()
-        lc = [float(i) for i in lc]
-        uc = [float(i) for i in uc]
-        # Right hand polygon
-        if right_hand_envelope:
-            envelope = (",").join(
-                [
-                    f"POLYGON(({lc[0]} {lc[1]}",
-                    f"{uc[0]} {lc[1]}",
-                    f"{uc[0]} {uc[1]}",
-                    f"{lc[0]} {uc[1]}",
-                    f"{lc[0]} {lc[1]}))",
-                ]
-            )
-            # return envelope
-        else:
-            min_x, max_x, min_y, max_y = lc[1], uc[1], lc[0], uc[0]
-            envelope = f"ENVELOPE({min_y},{max_y},{max_x},{min_x})"
-            # envelope = f"ENVELOPE({min_x},{max_x},{max_y},{min_y})"
-            # return  envelope
-        solr_bbox_query = "{!field f=bbox score=overlapRatio}" + f"Within({envelope})"
-        # params['fq'].append(solr_bbox_query)
-        return solr_bbox_query.strip()
-
-
-def parse_bbox_query(constraint, params, right_hand_envelope=False, or_flag=False):
-    # first check if there is a key: "ogc:Filter"
-    if or_flag: 
-        print('got the following OR constrasint: ', constraint)
-        return parse_bbox_OR_query(constraint)
-    else:
-        constraint = constraint["_dict"]["ogc:Filter"]
-    if "ogc:And" in constraint:
-        constraint = constraint["ogc:And"]
-    if "ogc:BBOX" in constraint:
-        print("Got bbox filter query")
-        lc = constraint["ogc:BBOX"]["gml:Envelope"]["gml:lowerCorner"].strip().split()
-        uc = constraint["ogc:BBOX"]["gml:Envelope"]["gml:upperCorner"].strip().split()
-        lc = [float(i) for i in lc]
-        uc = [float(i) for i in uc]
-        # Right hand polygon
-        if right_hand_envelope:
-            envelope = (",").join(
-                [
-                    f"POLYGON(({lc[0]} {lc[1]}",
-                    f"{uc[0]} {lc[1]}",
-                    f"{uc[0]} {uc[1]}",
-                    f"{lc[0]} {uc[1]}",
-                    f"{lc[0]} {lc[1]}))",
-                ]
-            )
-            # return envelope
-        else:
-            min_x, max_x, min_y, max_y = lc[1], uc[1], lc[0], uc[0]
-            envelope = f"ENVELOPE({min_y},{max_y},{max_x},{min_x})"
-            # envelope = f"ENVELOPE({min_x},{max_x},{max_y},{min_y})"
-            # return  envelope
-        solr_bbox_query = "{!field f=bbox score=overlapRatio}" + f"Within({envelope})"
-        params["fq"].append(solr_bbox_query)
-        return params
-    else:
-        return params
-
-
-def get_bbox(query, right_hand_envelope=False):
-    if "ogc:BBOX" in query["_dict"]["ogc:Filter"]:
-        print("Got bbox filter query")
-        lc = (
-            query["_dict"]["ogc:Filter"]["ogc:BBOX"]["gml:Envelope"]["gml:lowerCorner"]
-            .strip()
-            .split()
-        )
-        uc = (
-            query["_dict"]["ogc:Filter"]["ogc:BBOX"]["gml:Envelope"]["gml:upperCorner"]
-            .strip()
-            .split()
-        )
-        lc = [float(i) for i in lc]
-        uc = [float(i) for i in uc]
-        # Right hand polygon
-        if right_hand_envelope:
-            envelope = (",").join(
-                [
-                    f"POLYGON(({lc[0]} {lc[1]}",
-                    f"{uc[0]} {lc[1]}",
-                    f"{uc[0]} {uc[1]}",
-                    f"{lc[0]} {uc[1]}",
-                    f"{lc[0]} {lc[1]}))",
-                ]
-            )
-            return envelope
-        else:
-            min_x, max_x, min_y, max_y = lc[1], uc[1], lc[0], uc[0]
-            envelope = f"ENVELOPE({min_y},{max_y},{max_x},{min_x})"
-            # envelope = f"ENVELOPE({min_x},{max_x},{max_y},{min_y})"
-            print(envelope)
-            return envelope
-    if "ogc:And" in query["_dict"]["ogc:Filter"]:
-        if "ogc:BBOX" in query["_dict"]["ogc:Filter"]["ogc:And"]:
-            print("Got bbox AND filter query")
-            lc = (
-                query["_dict"]["ogc:Filter"]["ogc:And"]["ogc:BBOX"]["gml:Envelope"][
-                    "gml:lowerCorner"
-                ]
-                .strip()
-                .split()
-            )
-            uc = (
-                query["_dict"]["ogc:Filter"]["ogc:And"]["ogc:BBOX"]["gml:Envelope"][
-                    "gml:upperCorner"
-                ]
-                .strip()
-                .split()
-            )
-            lc = [float(i) for i in lc]
-            uc = [float(i) for i in uc]
-            # Right hand polygon
-            if right_hand_envelope:
-                envelope = (",").join(
-                    [
-                        f"POLYGON(({lc[0]} {lc[1]}",
-                        f"{uc[0]} {lc[1]}",
-                        f"{uc[0]} {uc[1]}",
-                        f"{lc[0]} {uc[1]}",
-                        f"{lc[0]} {lc[1]}))",
-                    ]
-                )
-                return envelope
+    return get_config_snapshot().collection_filter
+
+
+def get_queryables(context):
+    """
+    Return the flattened queryables of the pycsw model, computed once per
+    set of typenames. Every call gets its own copy, as pycsw rewrites the
+    mappings in place (util.transform_mappings).
+    """
+    key = tuple(context.model["typenames"])
+    queryables = _QUERYABLES.get(key)
+    if queryables is not None:
+        return {name: dict(mappings) for name, mappings in queryables.items()}
+
+    queryables = {}
+    for tname in context.model["typenames"]:
+        for qname in context.model["typenames"][tname]["queryables"]:
+            queryables[qname] = {}
+            items = context.model["typenames"][tname]["queryables"][qname].items()
+
+            for qkey, qvalue in items:
+                queryables[qname][qkey] = qvalue
+
+    # flatten all queryables
+    queryables["_all"] = {}
+    for qbl in queryables:
+        queryables["_all"].update(queryables[qbl])
+    queryables["_all"].update(context.md_core_model["mappings"])
+
+    _QUERYABLES[key] = queryables
+    return {name: dict(mappings) for name, mappings in queryables.items()}
+
+
+def get_xslt_transform(xslt_file):
+    """
+    Return the compiled XSLT for xslt_file from the process-wide registry.
+    The stylesheet is parsed and compiled once and recompiled only when its
+    mtime changes. lxml XSLT objects should not be shared between threads,
+    so each thread gets its own compiled copy.
+    """
+    mtime = os.stat(xslt_file).st_mtime_ns
+    registry = getattr(_XSLT_REGISTRY, "transforms", None)
+    if registry is None:
+        registry = _XSLT_REGISTRY.transforms = {}
+
+    cached = registry.get(xslt_file)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    transform = etree.XSLT(etree.parse(xslt_file))
+    registry[xslt_file] = (mtime, transform)
+    return transform
+
+
+def transform_mmd(doc, xslt_file):
+    """
+    Transform a parsed MMD document with xslt_file and return the root of
+    the result
+    """
+    transform = get_xslt_transform(xslt_file)
+    return transform(
+        doc, path_to_parent_list=etree.XSLT.strparam(PARENT_LIST)
+    ).getroot()
+
+
+def render_mmd(mmd_xml_file, xslt_file):
+    """
+    Transform a base64 encoded MMD document with xslt_file and return the
+    serialized result. Runs in transform worker processes.
+    """
+    doc = etree.fromstring(base64.b64decode(mmd_xml_file), MMD_PARSER)
+    return etree.tostring(transform_mmd(doc, xslt_file))
+
+
+def get_transform_executor(kind=None, workers=None):
+    """
+    Return the process-wide executor used to transform pages of records
+    ("thread" or "process" pool), or None when workers is 1 or less. kind
+    and workers default to transform_executor and transform_workers of the
+    [repository] configuration.
+    """
+    if kind is None or workers is None:
+        config = get_config()
+        if kind is None:
+            kind = config.get("repository", "transform_executor", fallback="thread")
+        if workers is None:
+            workers = config.getint("repository", "transform_workers", fallback=4)
+    if workers <= 1:
+        return None
+
+    key = (os.getpid(), kind, workers)
+    with _EXECUTORS_LOCK:
+        executor = _EXECUTORS.get(key)
+        if executor is None:
+            if kind == "process":
+                executor = ProcessPoolExecutor(max_workers=workers)
             else:
-                min_x, max_x, min_y, max_y = lc[1], uc[1], lc[0], uc[0]
-                envelope = f"ENVELOPE({min_y},{max_y},{max_x},{min_x})"
-                # envelope = f"ENVELOPE({min_x},{max_x},{max_y},{min_y})"
-                print(envelope)
-                return envelope
+                executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="mmd-transform"
+                )
+            _EXECUTORS[key] = executor
+    return executor
 
-        else:
-            print(f"ogc:BBOX not found in {query}")
-            return False
-    else:
-        return False
-
-
-def parse_time_query(constraint, params, and_flag=False):
-    # print('#################')
-    # print('calling parse_time_query with: \n', constraint, params, and_flag)
-    dateformat = "%Y-%m-%dT%H:%M:%SZ"
-    if not and_flag:
-        qstring = constraint["_dict"]["ogc:Filter"]
-    else:
-        qstring = constraint["_dict"]["ogc:Filter"]["ogc:And"]
-    if "ogc:PropertyIsGreaterThanOrEqualTo" in qstring:
-        tempBegin = qstring.get("ogc:PropertyIsGreaterThanOrEqualTo", False)
-        # print("tempBegin", type(tempBegin), tempBegin)
-        if tempBegin:
-            begin = qstring["ogc:PropertyIsGreaterThanOrEqualTo"]["ogc:Literal"]
-            # print('begin:', begin)
-            datestring = dparser.parse(begin)
-            # print(datestring)
-            params["fq"].append(
-                "temporal_extent_start_date:[%s TO *]" % datestring.strftime(dateformat)
-            )
-            # print(params)
-    if "ogc:PropertyIsLessThanOrEqualTo" in qstring:
-        tempEnd = qstring.get("ogc:PropertyIsLessThanOrEqualTo", False)
-        # print(tempEnd)
-        # print("tempEnd", type(tempEnd), tempEnd)
-        if tempEnd:
-            end = qstring["ogc:PropertyIsLessThanOrEqualTo"]["ogc:Literal"]
-            # print('end:', end)
-            datestring = dparser.parse(end)
-            # print(datestring)
-            params["fq"].append(
-                "temporal_extent_end_date:[* TO %s]" % datestring.strftime(dateformat)
-            )
-            # print(params)
-    # print('######## PARAMS just after calling time query #########')
-    # print(params)
-    # print('######## completed time query #########')
-    return params
-
-
-def parse_field_OR_query(constraint, and_flag=False, or_flag=False):
-    print("#### got the following constraint: ", constraint)
-    if or_flag:
-        property_name = list(constraint.keys())[0]
-        print("property_name: ", property_name)
-        qstring = constraint[property_name]["ogc:Literal"]
-        name = constraint[property_name]["ogc:PropertyName"].split(":")[-1]
-        print("name: ", name)
-        print("qstring: ", qstring)
-        return f"({name}:{qstring})"
-
-
-def parse_apiso_query(constraint, params, and_flag=False, or_flag=False):
-    # apiso:Type
-    if or_flag:
-        property_name = list(constraint.keys())[0]
-        print("property_name: ", property_name)
-        qstring = constraint[property_name]["ogc:Literal"]
-        name = constraint[property_name]["ogc:PropertyName"]
-        print("name: ", name)
-        print("qstring: ", qstring)
-    if not and_flag and not or_flag:
-        property_name = list(constraint["_dict"]["ogc:Filter"].keys())[0]
-        print("property_name: ", property_name)
-        qstring = constraint["_dict"]["ogc:Filter"][property_name]["ogc:Literal"]
-        name = constraint["_dict"]["ogc:Filter"][property_name]["ogc:PropertyName"]
-    if not or_flag and and_flag:
-        property_name = list(constraint["_dict"]["ogc:Filter"]["ogc:And"].keys())[0]
-        print("property_name: ", property_name)
-        qstring = constraint["_dict"]["ogc:Filter"]["ogc:And"][property_name][
-            "ogc:Literal"
-        ]
-        name = constraint["_dict"]["ogc:Filter"]["ogc:And"][property_name][
-            "ogc:PropertyName"
-        ]
-    qstring = qstring.replace("%", "*")
-    if "type" in name.lower():
-        print(f"got APISO type query with {name} set to {qstring}")
-        if qstring.lower() == "dataset":
-            params["fq"].append("isParent:false")
-        elif qstring.lower() == "series":
-            params["fq"].append("isParent:true")
-    if "apiso:Anytext" in name:
-            params["q"] = "full_text:(%s)" % qstring
-    return params
-
-def parse_field_query(constraint, params, and_flag=False, or_flag=False):
-    print("#### got the following constraint: ", constraint)
-    if or_flag:
-        property_name = list(constraint.keys())[0]
-        print("property_name: ", property_name)
-        qstring = constraint[property_name]["ogc:Literal"]
-        name = constraint[property_name]["ogc:PropertyName"]
-        print("name: ", name)
-        print("qstring: ", qstring)
-    if not and_flag and not or_flag:
-        property_name = list(constraint["_dict"]["ogc:Filter"].keys())[0]
-        print("property_name: ", property_name)
-        qstring = constraint["_dict"]["ogc:Filter"][property_name]["ogc:Literal"]
-        name = constraint["_dict"]["ogc:Filter"][property_name]["ogc:PropertyName"]
-    if not or_flag and and_flag:
-        property_name = list(constraint["_dict"]["ogc:Filter"]["ogc:And"].keys())[0]
-        print("property_name: ", property_name)
-        qstring = constraint["_dict"]["ogc:Filter"]["ogc:And"][property_name][
-            "ogc:Literal"
-        ]
-        name = constraint["_dict"]["ogc:Filter"]["ogc:And"][property_name][
-            "ogc:PropertyName"
-        ]
-    qstring = qstring.replace("%", "*")
-    if "title" in name.lower():
-        params["fq"].append("title:(%s)" % qstring)
-    elif "abstract" in name.lower():
-        params["fq"].append("abstract:(%s)" % qstring)
-    elif "subject" in name.lower():
-        params["fq"].append("keywords_keyword:(%s)" % qstring)
-    elif "creator" in name.lower():
-        params["fq"].append("personnel_investigator_name:(%s)" % qstring)
-    elif "contributor" in name.lower():
-        params["fq"].append(
-            "personnel_technical_name:(%s) OR personnel_metadata_author_name:(%s)"
-            % (qstring, qstring)
+
+def get_mmd_parser():
+    """
+    Return the MMD document parser of the calling thread, configured like
+    the pycsw parser
+    """
+    parser = getattr(_MMD_PARSERS, "parser", None)
+    if parser is None:
+        parser = etree.XMLParser(resolve_entities=False)
+        _MMD_PARSERS.parser = parser
+    return parser
+
+
+def get_mmd_tree(result, parser=None):
+    """
+    Return the parsed MMD document of a record, reusing the tree memoized
+    by repository records. Documents are parsed with parser, by default
+    with the parser of the calling thread.
+    """
+    tree = getattr(result, "mmd_tree", None)
+    if tree is None:
+        tree = etree.fromstring(
+            base64.b64decode(result.mmd_xml_file), parser or get_mmd_parser()
         )
-    elif "dc:source" in name:
-        params["fq"].append("related_url_landing_page:(%s)" % qstring)
-    elif "format" in name.lower():
-        params["fq"].append("storage_information_file_format:(%s)" % qstring)
-    elif "language" in name.lower():
-        params["fq"].append("dataset_language:(%s)" % qstring)
-    elif "publisher" in name.lower():
-        params["fq"].append("dataset_citation_publisher:(%s)" % qstring)
-    elif "rights" in name.lower():
-        params["fq"].append(
-            "use_constraint_identifier:(%s) OR use_constraint_license_text:(%s)"
-            % (qstring, qstring)
+    return tree
+
+
+def get_rendition_store():
+    """
+    Return the process-wide rendition store configured with
+    rendition_store, or None if it is disabled
+    """
+    config = get_config()
+    root = config.get("repository", "rendition_store", fallback="")
+    if not root:
+        return None
+    max_size = config.getint(
+        "repository", "rendition_store_max_size", fallback=1024 ** 3
+    )
+    evict_interval = config.getfloat(
+        "repository", "rendition_store_evict_interval", fallback=60
+    )
+
+    key = (root, max_size, evict_interval)
+    with _RENDITION_STORES_LOCK:
+        store = _RENDITION_STORES.get(key)
+        if store is None:
+            store = RenditionStore(root, max_size, evict_interval)
+            _RENDITION_STORES[key] = store
+    return store
+
+
+def rendition_key(result, xslt_file):
+    """
+    Key of the rendition of a record with xslt_file: the record identifier
+    and update times plus the stylesheet path and mtime. Returns None for
+    records without identifier or update time.
+    """
+    identifier = getattr(result, "identifier", None)
+    modified = getattr(result, "date_modified", None)
+    inserted = getattr(result, "insert_date", None)
+    if identifier is None or (modified is None and inserted is None):
+        return None
+
+    mtime = os.stat(xslt_file).st_mtime_ns
+    key = "|".join(str(i) for i in (identifier, modified, inserted, xslt_file, mtime))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _transform_record(result, xslt_file, parser=None):
+    return transform_mmd(get_mmd_tree(result, parser), xslt_file)
+
+
+def _transform(results, indexes, xslt_file, parser, executor):
+    # transforms of the records at indexes, in order: result roots, or
+    # serialized results from the process pool
+    if executor is None or len(indexes) < 2:
+        return [_transform_record(results[i], xslt_file, parser) for i in indexes]
+    if isinstance(executor, ProcessPoolExecutor):
+        return list(
+            executor.map(
+                render_mmd,
+                [results[i].mmd_xml_file for i in indexes],
+                [xslt_file] * len(indexes),
+            )
         )
-    else:
-        if "apiso:Anytext" in name:
-            params["q"] = "full_text:(%s)" % qstring
-    return params
+    # MMD documents are decoded and parsed on the pool threads, each with
+    # its own parser
+    return list(
+        executor.map(lambda i: _transform_record(results[i], xslt_file), indexes)
+    )
+
+
+def _transform_page(results, xslt_file, parser, executor, serialize):
+    """
+    Return the transforms of the MMD documents of a page of records with
+    xslt_file in order, serialized or as result roots. Renditions are read
+    from the rendition store first; the missing ones are transformed on
+    the transform executor and stored. Results are serialized or parsed
+    only when serialize or the rendition store asks for it.
+    """
+    if executor is None:
+        executor = get_transform_executor()
+
+    store = get_rendition_store()
+    keys = [None] * len(results)
+    rendered = [None] * len(results)
+    if store is not None:
+        keys = [rendition_key(result, xslt_file) for result in results]
+        for i, key in enumerate(keys):
+            xml = store.get(key) if key else None
+            if xml is not None and not serialize:
+                xml = etree.fromstring(xml, parser)
+            rendered[i] = xml
+
+    missing = [i for i, xml in enumerate(rendered) if xml is None]
+    if not missing:
+        return rendered
+
+    schema = os.path.splitext(os.path.basename(xslt_file))[0]
+    with span(
+        "xslt.%s" % schema, {"xslt.stylesheet": xslt_file, "records": len(missing)}
+    ), TRANSFORM_SECONDS.time(schema=schema):
+        try:
+            transformed = _transform(results, missing, xslt_file, parser, executor)
+        except Exception:
+            TRANSFORM_ERRORS.inc(schema=schema)
+            raise
+    TRANSFORM_RECORDS.inc(len(missing), schema=schema)
+
+    for i, output in zip(missing, transformed):
+        root = xml = None
+        if isinstance(output, bytes):
+            xml = output
+        else:
+            root = output
+        if xml is None and (serialize or keys[i] is not None):
+            xml = etree.tostring(root)
+        if keys[i] is not None:
+            store.put(keys[i], xml)
+        if serialize:
+            rendered[i] = xml
+        else:
+            rendered[i] = root if root is not None else etree.fromstring(xml, parser)
+
+    return rendered
+
+
+def render_records(results, xslt_file, parser=None, executor=None):
+    """
+    Return the serialized transforms of the MMD documents of a page of
+    records with xslt_file, in order
+    """
+    return _transform_page(results, xslt_file, parser, executor, serialize=True)
+
+
+def transform_records(results, xslt_file, parser=None, executor=None):
+    """
+    Transform the MMD documents of a page of records with xslt_file and
+    return the result roots in order
+    """
+    return _transform_page(results, xslt_file, parser, executor, serialize=False)
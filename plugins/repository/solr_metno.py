@@ -31,41 +31,317 @@
 # =================================================================
 
 import base64
-import configparser
-from datetime import datetime, timezone
-import dateutil.parser as dparser
 import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
 
-import requests
-
-from pycsw.core import util
 from pycsw.core.etree import etree
 import os
 
-from http.client import HTTPConnection  # py3
-
 import json
 
 LOGGER = logging.getLogger(__name__)
-# HTTPConnection.debuglevel = 1
 
 from pycsw.plugins.repository.solr_helper import (
+    get_config,
     get_collection_filter,
-    get_config_parser,
-    parse_time_query,
-    parse_field_query,
-    parse_field_OR_query,
-    parse_bbox_OR_query,
-    parse_bbox_query,
-    parse_apiso_query,
     get_iso_transformer,
+    get_mmd_parser,
+    get_queryables,
+    get_field_list,
+    format_datetime,
+    format_solr_date,
+    get_timestamp,
+    render_records,
+    ISO_OUTPUTSCHEMA,
+)
+from pycsw.plugins.repository.solr_transport import get_transport
+from pycsw.plugins.repository.solr_cache import SingleFlight, get_cache, params_key
+from pycsw.plugins.repository.solr_metrics import (
+    ERRORS,
+    QUERIES,
+    SOLR_NUM_FOUND,
+    configure_metrics,
+)
+from pycsw.plugins.repository.solr_trace import span
+from pycsw.plugins.repository.solr_filter import (
+    compile_filter,
+    constant_filter,
+    identifier_filter,
+    render_filter,
 )
 
-# I removed parse_bbox_OR_query by calling it internally via the OR flag in parse_bbox_query
-# and I should do the same for parse_field_OR_query
-# I should also remove parse_bbox_OR_query from solr_helper.py
-# and do the same for parse_field_OR_query
+
+# in-flight page fetches, shared by all repository objects of the process
+_FETCHES = SingleFlight()
+
+# background fetches of the next page of sequentially paged queries; at
+# most one (future, deadline) per paging sequence
+_PREFETCH_EXECUTORS = {}
+_PREFETCHES = {}
+_PREFETCH_LOCK = threading.Lock()
+
+
+def _renders_iso(outputschema, elementsetname):
+    """
+    Whether records are serialized as ISO XML
+    """
+    return outputschema == ISO_OUTPUTSCHEMA and elementsetname == "full"
+
+
+# page of a query as kept by the result and prefetch caches: the Solr docs
+# and, for ISO output, the rendered ISO XML of each doc. Pages are never
+# modified, records are built from them for every request.
+Page = namedtuple("Page", ["total", "docs", "xmls", "next_cursor_mark", "size"])
+
+
+def _estimate_size(docs, xmls=None):
+    """
+    Rough memory footprint in bytes of a page of Solr docs and their
+    rendered ISO XML
+    """
+    size = 0
+    for doc in docs:
+        size += 1024
+        for value in doc.values():
+            if isinstance(value, list):
+                size += sum(len(str(item)) for item in value)
+            else:
+                size += len(str(value))
+    if xmls is not None:
+        size += sum(len(xml or b"") for xml in xmls)
+    return size
+
+
+def _get_prefetch_executor():
+    """
+    Return the process-wide single thread executor running page prefetches
+    """
+    pid = os.getpid()
+    with _PREFETCH_LOCK:
+        executor = _PREFETCH_EXECUTORS.get(pid)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="solr-prefetch"
+            )
+            _PREFETCH_EXECUTORS[pid] = executor
+    return executor
+
+
+class RecordPage(object):
+    """
+    Records of one page of Solr docs. The ISO XML of all records of the
+    page is rendered together, on the transform executor, when the first
+    record of the page is serialized as ISO.
+    """
+
+    def __init__(self, records):
+        """
+        Initialize page and attach it to its records
+        """
+        self.records = records
+        self._lock = threading.Lock()
+        for record in records:
+            record._page = self
+
+    def render_iso(self):
+        """
+        Render the ISO XML of the records of the page which have an MMD
+        document and no ISO XML yet, then detach the page from its records
+        """
+        with self._lock:
+            records, self.records = self.records, []
+            pending = [
+                record
+                for record in records
+                if record._xml is None
+                and (record._mmd_xml_file is not None or record._mmd_tree is not None)
+            ]
+            if pending:
+                xmls = render_records(
+                    pending, get_iso_transformer(), pending[0]._parser
+                )
+                for record, xml in zip(pending, xmls):
+                    record._xml = xml
+            for record in records:
+                record._page = None
+
+
+class MMDRecord(object):
+    """
+    pycsw dataset object for a Solr doc. The decoded MMD tree and the ISO
+    XML are computed on first access and memoized, so outputs which do not
+    serialize the ISO XML never run the transform. Records built from a
+    page of Solr docs render the ISO XML of the whole page on the first
+    access. Once the MMD document is decoded, the tree is shared by all
+    outputs and the base64 text dropped. Fields not set for a record raise
+    AttributeError, as pycsw expects.
+    """
+
+    __slots__ = (
+        # pycsw core model mappings filled by _doc2record
+        "identifier",
+        "typename",
+        "schema",
+        "type",
+        "parentidentifier",
+        "wkt_geometry",
+        "title",
+        "abstract",
+        "topicategory",
+        "keywords",
+        "source",
+        "language",
+        "insert_date",
+        "date_modified",
+        "time_begin",
+        "time_end",
+        "links",
+        "creator",
+        "contributor",
+        "rights",
+        "accessconstraints",
+        "publisher",
+        "format",
+        "mdsource",
+        # MMD document and its lazily computed tree and ISO XML
+        "_mmd_xml_file",
+        "_mmd_tree",
+        "_xml",
+        "_parser",
+        # RecordPage of the record until its ISO XML is rendered
+        "_page",
+    )
+
+    def __init__(self, record, parser=None):
+        """
+        Initialize record
+        """
+        self._mmd_xml_file = None
+        for name, value in record.items():
+            if name == "mmd_xml_file":
+                self._mmd_xml_file = value
+            else:
+                setattr(self, name, value)
+        self._parser = parser
+        self._mmd_tree = None
+        self._xml = None
+        self._page = None
+
+    @property
+    def mmd_xml_file(self):
+        """
+        Base64 encoded MMD document
+        """
+        mmd = self._mmd_xml_file
+        if mmd is None:
+            # already decoded: serialize the shared tree again
+            return base64.b64encode(etree.tostring(self.mmd_tree))
+        return mmd
+
+    @property
+    def mmd_tree(self):
+        """
+        Decoded and parsed MMD document
+        """
+        tree = self._mmd_tree
+        if tree is None:
+            mmd = self._mmd_xml_file
+            if mmd is None:
+                # decoded meanwhile by another thread, or no MMD at all
+                if self._mmd_tree is None:
+                    raise AttributeError("mmd_tree")
+                return self._mmd_tree
+            # parsed by the thread asking for the tree, e.g. a transform
+            # thread, with its own parser
+            tree = etree.fromstring(base64.b64decode(mmd), get_mmd_parser())
+            self._mmd_tree = tree
+            self._mmd_xml_file = None
+        return tree
+
+    @property
+    def xml(self):
+        """
+        MMD record transformed to ISO
+        """
+        if self._xml is None:
+            page = self._page
+            if page is not None:
+                page.render_iso()
+            if self._xml is None:
+                self._xml = render_records(
+                    [self], get_iso_transformer(), self._parser
+                )[0]
+        return self._xml
+
+
+class RecordStream(object):
+    """
+    Page of records fetched from Solr in chunks and transformed while it is
+    iterated, so memory is bounded by the chunk size rather than by
+    maxrecords. Can be iterated once.
+    """
+
+    def __init__(
+        self,
+        repository,
+        params,
+        response,
+        startposition,
+        maxrecords,
+        render_iso=False,
+        cursor_key=None,
+    ):
+        """
+        Initialize stream from the response to the first chunk
+        """
+        self.repository = repository
+        self.params = params
+        self.startposition = startposition
+        self.render_iso = render_iso
+        self.cursor_key = cursor_key
+        self.total = response["response"]["numFound"]
+        self._length = max(0, min(maxrecords, self.total - startposition))
+        self._response = response
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        params = dict(self.params)
+        chunk_size = params["rows"]
+        response, self._response = self._response, None
+        emitted = 0
+
+        while response is not None:
+            docs = response["response"]["docs"][: self._length - emitted]
+            records = self.repository._build_records(docs, self.render_iso)
+            del docs
+            # hand records over one at a time, keeping no reference
+            records.reverse()
+            while records:
+                emitted += 1
+                yield records.pop()
+
+            if emitted >= self._length or not response["response"]["docs"]:
+                break
+
+            if "cursorMark" in params:
+                params["cursorMark"] = response["nextCursorMark"]
+            else:
+                params["start"] = self.startposition + emitted
+            params["rows"] = min(chunk_size, self._length - emitted)
+            response = self.repository.transport.select(params)
+
+        if response is not None and "nextCursorMark" in response:
+            self.repository._cursor_cache().set(
+                (self.cursor_key, self.startposition + emitted),
+                response["nextCursorMark"],
+            )
+
 
 class SOLRMETNORepository(object):
     """
@@ -84,62 +360,49 @@ class SOLRMETNORepository(object):
         self.local_ingest = True
         self.solr_select_url = "%s/select" % self.filter
         self.dbtype = "SOLR"
+        self.transport = get_transport(self.filter, get_config())
+        configure_metrics(get_config())
+        # filter planning decisions of the last query, see solr_filter
+        self.query_plan = []
 
-        # self.config_obj = get_config()
+        # configuration and queryables are cached per process
         self.adc_collection_filter = get_collection_filter()
-        # print(self.adc_collection_filter)
-
-        # generate core queryables db and obj bindings
-        self.queryables = {}
-
-        for tname in self.context.model["typenames"]:
-            for qname in self.context.model["typenames"][tname]["queryables"]:
-                self.queryables[qname] = {}
-                items = self.context.model["typenames"][tname]["queryables"][
-                    qname
-                ].items()
-
-                for qkey, qvalue in items:
-                    self.queryables[qname][qkey] = qvalue
-
-        # flatten all queryables
-        self.queryables["_all"] = {}
-        for qbl in self.queryables:
-            self.queryables["_all"].update(self.queryables[qbl])
-        self.queryables["_all"].update(self.context.md_core_model["mappings"])
+        self.queryables = get_queryables(self.context)
 
         # self.dataset = type('dataset', (object,), {})
 
     def dataset(self, record):
         """
-        Stub to mock a pycsw dataset object for Transactions
+        Build a pycsw dataset object from a record dict
         """
-        # print('dataset stub')
-        return type("dataset", (object,), record)
+        return MMDRecord(record, self.context.parser)
 
-    def query_ids(self, ids):
+    def query_ids(self, ids, outputschema=None, elementsetname=None):
         """
         Query by list of identifiers
         """
+        QUERIES.inc(method="query_ids")
 
         results = []
 
         params = {
-            "fq": ['metadata_identifier:("%s")' % '" OR "'.join(ids)],
+            "fq": [render_filter(identifier_filter(ids))],
             "q.op": "OR",
             "q": "*:*",
+            # Solr returns 10 rows unless asked for more
+            "rows": len(ids),
+            "fl": ",".join(get_field_list(outputschema, elementsetname)),
         }
-        params["fq"].append("metadata_status:%s" % "Active")
-        if self.adc_collection_filter != "" or self.adc_collection_filter != None:
-            params["fq"].append("collection:(%s)" % self.adc_collection_filter)
+        params["fq"].append(render_filter(self._constant_filter()))
 
-        print(params)
-        response = requests.get(self.solr_select_url, params=params)
+        LOGGER.debug("Solr params: %s", params)
+        response = self.transport.select(params)
+        SOLR_NUM_FOUND.observe(response["response"]["numFound"], method="query_ids")
 
-        response = response.json()
-
-        for doc in response["response"]["docs"]:
-            results.append(self._doc2record(doc))
+        results = self._build_records(
+            response["response"]["docs"],
+            render_iso=_renders_iso(outputschema, elementsetname),
+        )
         # print("query by ID \n")
         return results
 
@@ -148,6 +411,7 @@ class SOLRMETNORepository(object):
         Query by property domain values
         """
         # print('Query domain')
+        QUERIES.inc(method="query_domain")
         results = []
 
         params = {
@@ -159,12 +423,10 @@ class SOLRMETNORepository(object):
             "facet.field": domain,
             "fq": [],
         }
-        params["fq"].append("metadata_status:%s" % "Active")
-        if self.adc_collection_filter != "" or self.adc_collection_filter != None:
-            params["fq"].append("collection:(%s)" % self.adc_collection_filter)
+        params["fq"].append(render_filter(self._constant_filter()))
 
-        print(params)
-        response = requests.get("%s/select" % self.filter, params=params).json()
+        LOGGER.debug("Solr params: %s", params)
+        response = self.transport.select(params)
 
         counts = response["facet_counts"]["facet_fields"][domain]
 
@@ -176,9 +438,11 @@ class SOLRMETNORepository(object):
 
     def query_insert(self, direction="max"):
         """
-        Query to get latest (default) or earliest update to repository
+        Query to get latest (default) or earliest update to repository,
+        None for an empty repository
         """
         # print('query_insert')
+        QUERIES.inc(method="query_insert")
         if direction == "min":
             sort_order = "asc"
         else:
@@ -189,19 +453,18 @@ class SOLRMETNORepository(object):
             "q.op": "OR",
             "fl": "timestamp",
             "sort": "timestamp %s" % sort_order,
+            "rows": 1,
             "fq": [],
         }
-        params["fq"].append("metadata_status:%s" % "Active")
-        if self.adc_collection_filter != "" or self.adc_collection_filter != None:
-            params["fq"].append("collection:(%s)" % self.adc_collection_filter)
+        params["fq"].append(render_filter(self._constant_filter()))
 
-        response = requests.get("%s/select" % self.filter, params=params).json()
-
-        timestamp = datetime.strptime(
-            response["response"]["docs"][0]["timestamp"], "%Y-%m-%dT%H:%M:%S.%fZ"
-        )
+        response = self.transport.select(params)
 
-        return timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+        docs = response["response"]["docs"]
+        timestamp = get_timestamp(docs[0]) if docs else None
+        if timestamp is None:
+            return None
+        return format_solr_date(timestamp)
 
     def query_source(self, source):
         """
@@ -211,155 +474,384 @@ class SOLRMETNORepository(object):
         return NotImplementedError()
 
     def query(
-        self, constraint, sortby=None, typenames=None, maxrecords=10, startposition=0
+        self,
+        constraint,
+        sortby=None,
+        typenames=None,
+        maxrecords=10,
+        startposition=0,
+        outputschema=None,
+        elementsetname=None,
+        resulttype=None,
     ):
         """
-        Query records from underlying repository
+        Query records from underlying repository. outputschema and
+        elementsetname restrict the Solr field list to what the requested
+        output serializes; by default all fields are returned. With
+        resulttype="hits" or maxrecords=0 only the count is fetched.
         """
-        # DEBUG:
-        # if "_dict" in constraint:
-        #     print("constraint: ", constraint['_dict'])
-        print(" #####  get_iso_transformer #####", "\n", get_iso_transformer(), "\n", "#####  get_iso_transformer #####")
-        # mmd_to_NOiso
-        print(json.dumps(constraint, indent=2, default=str))
+        LOGGER.debug("Constraint: %s", constraint)
+        QUERIES.inc(method="query")
+
+        # pycsw passes maxRecords and startPosition of requests as strings
+        maxrecords = int(maxrecords)
+        startposition = int(startposition)
+
+        if maxrecords == 0 or resulttype == "hits":
+            total = self.query_count(constraint)
+            SOLR_NUM_FOUND.observe(total, method="query")
+            return str(total), []
+
+        query_params = self._constraint_params(constraint)
+        params, cursor_key = self._page_params(
+            query_params,
+            startposition,
+            maxrecords,
+            ",".join(get_field_list(outputschema, elementsetname)),
+        )
 
-        results = []
+        LOGGER.debug("Solr params: %s", params)
+
+        render_iso = _renders_iso(outputschema, elementsetname)
+
+        chunk_size = get_config().getint("repository", "stream_chunk_size", fallback=0)
+        if 0 < chunk_size < maxrecords:
+            # large pages are fetched and transformed chunk by chunk while
+            # pycsw serializes them
+            params["rows"] = chunk_size
+            stream = RecordStream(
+                self,
+                params,
+                self.transport.select(params),
+                startposition,
+                maxrecords,
+                render_iso,
+                cursor_key,
+            )
+            LOGGER.debug("Found: %s", stream.total)
+            SOLR_NUM_FOUND.observe(stream.total, method="query")
+            return str(stream.total), stream
+
+        result_cache = self._result_cache()
+        cache_key = (self._cache_key(params), outputschema)
+        page_key = (self._cache_key(params), render_iso)
+        page = results = None
+        if result_cache is not None:
+            page = result_cache.get(cache_key)
+        prefetch_cache = self._prefetch_cache()
+        if page is None and prefetch_cache is not None:
+            page = prefetch_cache.pop(page_key)
+            if page is not None and result_cache is not None:
+                result_cache.set(cache_key, page, size=page.size)
+        if page is None:
+            # concurrent identical queries share one Solr request and one
+            # record building pass
+            page, results = _FETCHES.do(page_key, self._fetch, params, render_iso)
+            if result_cache is not None:
+                result_cache.set(cache_key, page, size=page.size)
+        if results is None:
+            results = self._build_records(page.docs, render_iso, page.xmls)
+
+        total = page.total
+        LOGGER.debug("Found: %s", total)
+        SOLR_NUM_FOUND.observe(total, method="query")
+
+        if page.next_cursor_mark is not None:
+            # remember where the next page (nextRecord) starts
+            next_record = startposition + len(results)
+            self._cursor_cache().set((cursor_key, next_record), page.next_cursor_mark)
+
+        if prefetch_cache is not None:
+            self._prefetch_next(
+                query_params, startposition, maxrecords, params["fl"], render_iso, total
+            )
+
+        return str(total), list(results)
+
+    def _cache_key(self, params):
+        """
+        Key of the Solr params of a query in the process-wide caches, which
+        are shared by the repositories of all Solr cores
+        """
+        return self.filter, params_key(params)
+
+    def _page_params(self, params, startposition, maxrecords, fl):
+        """
+        Add paging and field list to the Solr params of a query. Returns the
+        params and, with cursor_paging, the key of the query's cursor marks.
+        """
+        params = dict(params)
+
+        cursor_key = None
+        if get_config().getboolean("repository", "cursor_paging", fallback=False):
+            # deep paging: a stable sort on the unique key lets Solr resume
+            # from the cursor mark left by the previous page
+            params["sort"] = "metadata_identifier asc"
+            cursor_key = self._cache_key(params)
+            cursor_mark = self._cursor_cache().get((cursor_key, startposition))
+            if startposition == 0:
+                cursor_mark = "*"
+            if cursor_mark is not None:
+                params["cursorMark"] = cursor_mark
+
+        # Solr requires start=0 together with a cursor mark
+        params["start"] = 0 if "cursorMark" in params else startposition
+        params["rows"] = maxrecords
+        params["fl"] = fl
+
+        return params, cursor_key
+
+    def _prefetch_cache(self):
+        """
+        Process-wide cache of prefetched pages, or None if prefetching is
+        disabled. prefetch_max_bytes bounds the memory held by prefetched
+        pages; pages not requested within prefetch_ttl seconds are dropped.
+        """
+        config = get_config()
+        if not config.getboolean("repository", "prefetch", fallback=False):
+            return None
+
+        return get_cache(
+            "prefetch",
+            maxsize=config.getint("repository", "prefetch_cache_size", fallback=64),
+            ttl=config.getfloat("repository", "prefetch_ttl", fallback=30),
+            maxbytes=config.getint(
+                "repository", "prefetch_max_bytes", fallback=128 * 1024 * 1024
+            ),
+        )
+
+    def _prefetch_next(
+        self, params, startposition, maxrecords, fl, render_iso, total
+    ):
+        """
+        Fetch the page following startposition in the background if the
+        client pages sequentially, i.e. requests the same query (params,
+        without paging) where its previous page ended. Each paging sequence
+        has at most one prefetch outstanding. A queued prefetch is cancelled
+        when the client leaves the sequence or does not continue it within
+        prefetch_ttl seconds.
+        """
+        prefetch_cache = self._prefetch_cache()
+        query_key = (
+            self._cache_key(dict(params, rows=maxrecords, fl=fl)),
+            render_iso,
+        )
+        next_start = startposition + maxrecords
+
+        paging = get_cache("paging", maxsize=1024, ttl=prefetch_cache.ttl)
+        expected = paging.get(query_key)
+        paging.set(query_key, next_start)
+
+        next_params, _ = self._page_params(params, next_start, maxrecords, fl)
+        executor = _get_prefetch_executor()
+        now = time.monotonic()
+        with _PREFETCH_LOCK:
+            for key, (future, deadline) in list(_PREFETCHES.items()):
+                if deadline < now:
+                    # sequence abandoned
+                    future.cancel()
+                    del _PREFETCHES[key]
+            pending = _PREFETCHES.pop(query_key, None)
+
+            if pending is not None and not pending[0].done():
+                # the client left the sequence or outran the prefetch
+                if not pending[0].cancel():
+                    # still running, keep it as the prefetch of the sequence
+                    _PREFETCHES[query_key] = pending
+                    return
+                LOGGER.debug("Pending prefetch cancelled")
+            if expected != startposition or next_start >= total:
+                return
+
+            # registered before the prefetch can start, see _prefetch
+            _PREFETCHES[query_key] = (
+                executor.submit(
+                    self._prefetch, query_key, next_params, render_iso, prefetch_cache
+                ),
+                now + prefetch_cache.ttl,
+            )
+
+    def _prefetch(self, query_key, params, render_iso, prefetch_cache):
+        """
+        Fetch a page into the prefetch cache, unless its paging sequence was
+        abandoned while the prefetch was queued
+        """
+        with _PREFETCH_LOCK:
+            pending = _PREFETCHES.get(query_key)
+        if pending is None or pending[1] < time.monotonic():
+            return
+
+        key = (self._cache_key(params), render_iso)
+        try:
+            page, _ = _FETCHES.do(key, self._fetch, params, render_iso)
+        except Exception as err:
+            LOGGER.warning("Prefetch failed: %s", err)
+            return
+        prefetch_cache.set(key, page, size=page.size)
+
+    def _fetch(self, params, render_iso=False):
+        """
+        Run a select and build the records of the returned page. Returns the
+        Page to cache and the records
+        """
+        response = self.transport.select(params)
+
+        docs = tuple(response["response"]["docs"])
+        results = self._build_records(docs, render_iso)
+        xmls = None
+        if render_iso:
+            xmls = tuple(result._xml for result in results)
+
+        page = Page(
+            total=response["response"]["numFound"],
+            docs=docs,
+            xmls=xmls,
+            next_cursor_mark=response.get("nextCursorMark"),
+            size=_estimate_size(docs, xmls),
+        )
+        return page, results
 
-        dateformat = "%Y-%m-%dT%H:%M:%SZ"
+    def _build_records(self, docs, render_iso=False, xmls=None):
+        """
+        Turn a page of Solr docs into records, keeping their order. The MMD
+        documents of the page are decoded, parsed and transformed to ISO XML
+        concurrently on the transform executor configured with
+        transform_workers and transform_executor ("thread" or "process"):
+        up front with render_iso, otherwise when the first record of the
+        page is serialized as ISO. xmls are ISO XML already rendered for the
+        docs, e.g. by a cached page.
+        """
+        with span("doc2record", {"docs": len(docs)}):
+            results = [self._doc2record(doc) for doc in docs]
+        if xmls is not None:
+            for result, xml in zip(results, xmls):
+                result._xml = xml
+
+        if render_iso:
+            rendered = [
+                r for r in results if r._xml is None and r._mmd_xml_file is not None
+            ]
+            xmls = render_records(rendered, get_iso_transformer(), self.context.parser)
+            for result, xml in zip(rendered, xmls):
+                result._xml = xml
+        elif len(results) > 1:
+            RecordPage(results)
+
+        return results
+
+    def _result_cache(self):
+        """
+        Process-wide cache of query results, or None if disabled. The cache
+        is cleared when the newest record timestamp (the index version)
+        changes; the version is checked at most every
+        result_cache_version_interval seconds. The cache is bypassed when
+        the version cannot be checked.
+        """
+        config = get_config()
+        if not config.getboolean("repository", "result_cache", fallback=False):
+            return None
+
+        result_cache = get_cache(
+            "result",
+            maxsize=config.getint("repository", "result_cache_size", fallback=256),
+            ttl=config.getfloat("repository", "result_cache_ttl", fallback=300),
+            maxbytes=config.getint(
+                "repository", "result_cache_max_bytes", fallback=64 * 1024 * 1024
+            ),
+        )
+        interval = config.getfloat(
+            "repository", "result_cache_version_interval", fallback=10
+        )
+        if time.monotonic() - result_cache.version_checked > interval:
+            try:
+                version = self.query_insert()
+            except Exception as err:
+                # without a known index version cached pages may be stale
+                LOGGER.warning("Result cache version check failed: %s", err)
+                return None
+            result_cache.set_version(version)
+
+        return result_cache
+
+    def _cursor_cache(self):
+        """
+        Process-wide cache of Solr cursor marks, keyed on the Solr query and
+        the record position each mark starts at
+        """
+        config = get_config()
+        return get_cache(
+            "cursor",
+            maxsize=config.getint("repository", "cursor_cache_size", fallback=1024),
+            ttl=config.getfloat("repository", "cursor_cache_ttl", fallback=600),
+        )
+
+    def query_count(self, constraint):
+        """
+        Count records matching constraint without fetching any document.
+        Counts are cached for a short time, keyed on the Solr params.
+        """
+        params = self._constraint_params(constraint)
+        params["rows"] = 0
+
+        config = get_config()
+        count_cache = get_cache(
+            "count",
+            maxsize=config.getint("repository", "count_cache_size", fallback=1024),
+            ttl=config.getfloat("repository", "count_cache_ttl", fallback=30),
+        )
+        key = self._cache_key(params)
+
+        total = count_cache.get(key)
+        if total is None:
+            response = self.transport.select(params)
+            total = response["response"]["numFound"]
+            count_cache.set(key, total)
+
+        return total
+
+    def _constant_filter(self):
+        """
+        Filter on active records of the configured collections
+        """
+        clauses = ["metadata_status:Active"]
+        if self.adc_collection_filter:
+            clauses.append("collection:(%s)" % self.adc_collection_filter)
+        return constant_filter(clauses)
+
+    def _constraint_params(self, constraint):
+        """
+        Translate a pycsw constraint into Solr q/fq params
+        """
         # Default search params
         params = {
             "q": "*:*",
             "q.op": "OR",
-            "start": startposition,
-            "rows": maxrecords,
-            "fq": [],
         }
-        # Add filter for active records
-        params["fq"].append("metadata_status:%s" % "Active")
-        # Add filter for collection
-        if self.adc_collection_filter != "" or self.adc_collection_filter != None:
-            params["fq"].append("collection:(%s)" % self.adc_collection_filter)
+        # status and collection filters are the same for every request
+        query_plan = [self._constant_filter()]
 
         # Only add query constraint if we have some, else return all records
         if len(constraint) != 0:
-            # print('parsing constraints')
-            # Do/check for  spatial search
-            params = parse_bbox_query(
-                constraint, params, right_hand_envelope=False, or_flag=False
-            )
-            # Do/check for  text search
-            # here I unify the query string for the text search
-            # both for PropertyIsLike and PropertyIsEqualTo
-            # it will execute the same query
-            qstring = "*:*"
-            anytext_constraint = ["ogc:PropertyIsLike", "ogc:PropertyIsEqualTo"]
-            if any(
-                item in constraint["_dict"]["ogc:Filter"] for item in anytext_constraint
-            ):
-                params = parse_field_query(constraint, params, and_flag=False)
-                # add apiso query filter:
-                params = parse_apiso_query(constraint, params, and_flag=False)
-            if not any(
-                item in constraint["_dict"]["ogc:Filter"] for item in anytext_constraint
-            ):
-                if "ogc:And" not in constraint["_dict"]["ogc:Filter"]:
-                    print(
-                        "############## here comes a query without AnyText and without AND ##############"
-                    )
-
-            print('check 1st OR in ["_dict"]["ogc:Filter"]')
-            if "ogc:Or" in constraint["_dict"]["ogc:Filter"]:
-                print("Got OR")
-                print("OR constraint: ", constraint["_dict"]["ogc:Filter"]["ogc:Or"])
-                # print('WARNING: OR query Not implemented yet')
-                # print('WARNING: shall we return 0 results?')
-                if "ogc:And" in constraint["_dict"]["ogc:Filter"]["ogc:Or"]:
-                    q_query_list = []
-                    for i, v in enumerate(
-                        constraint["_dict"]["ogc:Filter"]["ogc:Or"]["ogc:And"]
-                    ):
-                        # here we could add a query time parser
-                        # to check if the query is a time query
-                        if "ogc:PropertyIsLike" in list(v.keys()):
-                            # here we could check if the propert is equal to instead of just like
-                            print("found PropertyIsLike")
-                            q_query = parse_field_OR_query(v, or_flag=True)
-                        if "ogc:BBOX" in list(v.keys()):
-                            print("found BBOX")
-                            print(v["ogc:BBOX"])
-                            # print(get_bbox(constraint["_dict"]["ogc:Filter"]["ogc:Or"]["ogc:And"][0]['ogc:BBOX']))
-                            
-                            # solr_bbox_query = parse_bbox_OR_query(
-                            #     v, right_hand_envelope=False
-                            # )
-                            # print("v: ", v)
-                            solr_bbox_query = parse_bbox_query(
-                                v, params=None, right_hand_envelope=False, or_flag=True  
-                            )
-                            print("solr_bbox_query_test: ", solr_bbox_query)
-                            
-                            q_query = f'{q_query[:-1]} && _query_:"{solr_bbox_query}")'
-                        q_query_list.append(q_query)
-                    q_query_string = (" OR ").join(q_query_list)
-                    print("q_query_string: ", q_query_string)
-                print(constraint["_dict"]["ogc:Filter"]["ogc:Or"].keys())
-                params["q"] = q_query_string
-
-            print('Check 1st AND in ["_dict"]["ogc:Filter"]')
-            if "ogc:And" in constraint["_dict"]["ogc:Filter"]:
-                print("Got 1st AND")
-                if "ogc:Or" in constraint["_dict"]["ogc:Filter"]["ogc:And"]:
-                    print("Got OR inside 1st And")
-                    print(
-                        "OR constraint: ",
-                        constraint["_dict"]["ogc:Filter"]["ogc:And"]["ogc:Or"],
-                    )
-                    print("WARNING: Or Query in 1st AND Not implemented yet")
-                    print("WARNING: shall we return 0 results?")
-                print("1st AND: parsing query for time constraint")
-                params = parse_time_query(constraint, params, and_flag=True)
-
-                if any(
-                    item in constraint["_dict"]["ogc:Filter"]["ogc:And"]
-                    for item in anytext_constraint
-                ):
-                    print("executing parse_field_query inside 1st AND")
-                    params = parse_field_query(constraint, params, and_flag=True)
-                    params = parse_apiso_query(constraint, params, and_flag=True)
-
-                if "ogc:And" in constraint["_dict"]["ogc:Filter"]["ogc:And"]:
-                    print("Got AND _ AND ")
-                    print(constraint["_dict"]["ogc:Filter"]["ogc:And"])
-
-        print("#########################################################\n")
-        print("#################", params["q"], "###############################")
-        print(json.dumps(params, indent=2, default=str))
-
-        # print(('%s/select' % self.filter, params=params).json())
-        response = requests.get("%s/select" % self.filter, params=params).json()
-
-        # print("######################  ---  ###################################\n")
-        # print('%s/select' % self.filter)
-        # print(params)
-        # print(response)
-        # print(len(response['response']['docs']))
-        # for i in response['response']['docs']:
-        #    print(i['metadata_identifier'])
-        # print("######################  ---  ###################################\n")
-
-        total = response["response"]["numFound"]
-        # response = response.json()
-        print("Found: %s" % total)
-        for doc in response["response"]["docs"]:
-            results.append(self._doc2record(doc))
-            # print(doc['metadata_identifier'])
-        # print(total)
-
-        return str(total), results
-
-    def _doc2record(self, doc):
-        """
-        Transform a SOLR doc into a pycsw dataset object
+            with span("filter"):
+                try:
+                    compiled = compile_filter(constraint["_dict"])
+                except NotImplementedError:
+                    ERRORS.inc(stage="filter")
+                    raise
+            params["q"] = compiled.q
+            query_plan.extend(compiled.filters)
+
+        # keep the planning decisions for inspection
+        self.query_plan = query_plan
+        LOGGER.debug("Filter plan: %s", query_plan)
+        params["fq"] = [render_filter(planned) for planned in query_plan]
+
+        return params
+
+    def _doc2record(self, doc, render_iso=False):
+        """
+        Transform a SOLR doc into a pycsw dataset object, rendering its ISO
+        XML right away if render_iso is set
         """
 
         record = {}
@@ -379,7 +871,8 @@ class SOLRMETNORepository(object):
         # record["type"] = "dataset"
         record["wkt_geometry"] = doc["bbox"]
         record["title"] = doc["title"][0]
-        record["abstract"] = doc["abstract"][0]
+        if "abstract" in doc:
+            record["abstract"] = doc["abstract"][0]
         if "iso_topic_category" in doc:
             record["topicategory"] = ",".join(doc["iso_topic_category"])
         if "keywords_keyword" in doc:
@@ -391,21 +884,20 @@ class SOLRMETNORepository(object):
             record["language"] = doc["dataset_language"]
 
         # Transform the indexed time as insert_data
-        insert = dparser.parse(doc["timestamp"][0])
-        record["insert_date"] = insert.isoformat()
+        if "timestamp" in doc:
+            record["insert_date"] = format_datetime(get_timestamp(doc))
 
         # Transform the last metadata update datetime as modified
         if "last_metadata_update_datetime" in doc:
-            modified = dparser.parse(doc["last_metadata_update_datetime"][0])
-            record["date_modified"] = modified.isoformat()
+            record["date_modified"] = format_datetime(
+                doc["last_metadata_update_datetime"][0]
+            )
 
         # Transform temporal extendt start and end dates
         if "temporal_extent_start_date" in doc:
-            time_begin = dparser.parse(doc["temporal_extent_start_date"][0])
-            record["time_begin"] = time_begin.isoformat()
+            record["time_begin"] = format_datetime(doc["temporal_extent_start_date"][0])
         if "temporal_extent_end_date" in doc:
-            time_end = dparser.parse(doc["temporal_extent_end_date"][0])
-            record["time_end"] = time_end.isoformat()
+            record["time_end"] = format_datetime(doc["temporal_extent_end_date"][0])
 
         links = []
         if "data_access_url_opendap" in doc:
@@ -484,23 +976,11 @@ class SOLRMETNORepository(object):
         if "storage_information_file_format" in doc:
             record["format"] = doc["storage_information_file_format"]
 
-        # xslt = os.environ.get('MMD_TO_ISO')
-        xslt_file = get_iso_transformer()
-        # xslt_file = get_config_parser("xslt", "mmd_to_iso")
-
-        transform = etree.XSLT(etree.parse(xslt_file))
-        xml_ = base64.b64decode(doc["mmd_xml_file"])
-        # print("xml_: ", xml_)
-
-        doc_ = etree.fromstring(xml_, self.context.parser)
-        # print("doc_:", doc_)
-        pl = '/usr/local/share/parent_list.xml'
-        result_tree = transform(doc_, path_to_parent_list=etree.XSLT.strparam(pl)).getroot()
-        # result_tree = transform(doc_).getroot()
-        record["xml"] = etree.tostring(result_tree)
-        record["mmd_xml_file"] = doc["mmd_xml_file"]
+        # the ISO XML is rendered lazily by the dataset object, only when
+        # an output actually serializes it
+        if "mmd_xml_file" in doc:
+            record["mmd_xml_file"] = doc["mmd_xml_file"]
 
-        # print(record['xml'])
         params = {
             #'fq': doc['metadata_identifier'],
             "q.op": "OR",
@@ -510,4 +990,7 @@ class SOLRMETNORepository(object):
         mdsource_url = self.solr_select_url + urlencode(params)
         record["mdsource"] = mdsource_url
 
-        return self.dataset(record)
+        result = self.dataset(record)
+        if render_iso and "mmd_xml_file" in record:
+            result.xml
+        return result
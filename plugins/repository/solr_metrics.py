@@ -0,0 +1,473 @@
+"""
+Prometheus style metrics of the Solr repository and its outputs.
+
+Metrics are kept per process. With metrics_dir set in the [repository]
+configuration, every process writes its metrics to <metrics_dir>/<pid>.json
+at most every metrics_flush_interval seconds, and the exposition merges the
+files of all running worker processes. When a process exits, its metrics
+are added to <metrics_dir>/retired.json and its file is removed, so merged
+counters do not drop when workers are recycled; files left by processes
+which did not exit cleanly are retired by the next exposition. Metrics are
+exposed in the Prometheus text format by MetricsMiddleware, e.g. on
+/metrics of the pycsw WSGI application, or written to a file for the node
+exporter textfile collector:
+
+    PYCSW_CONFIG=default.cfg python -m pycsw.plugins.repository.solr_metrics \\
+        --output /var/lib/node_exporter/adc_pycsw.prom
+"""
+
+import argparse
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from pycsw.plugins.repository.solr_cache import cache_stats
+
+LOGGER = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# metrics of the process, keyed by name
+_METRICS = {}
+_METRICS_LOCK = threading.Lock()
+
+# merged metrics of the exited processes of the metrics directory, and the
+# lock file serializing its updates with the expositions
+RETIRED_FILE = "retired.json"
+LOCK_FILE = "metrics.lock"
+
+_DIRECTORY = None
+_FLUSH_INTERVAL = 5.0
+_FLUSHED = 0.0
+# whether the process recorded any metric, processes which did not (e.g.
+# the exposition command) write no metrics file
+_RECORDED = False
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Counter(object):
+    """
+    Monotonic counter with labels
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        """
+        Initialize counter
+        """
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the counter with labels by amount
+        """
+        key = _labels_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _maybe_flush()
+
+    def set(self, value, **labels):
+        """
+        Set the counter with labels, for counters kept elsewhere
+        """
+        with self._lock:
+            self.values[_labels_key(labels)] = value
+
+    def dump(self):
+        with self._lock:
+            return [[dict(key), value] for key, value in self.values.items()]
+
+
+class Histogram(object):
+    """
+    Histogram with labels and fixed buckets
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        """
+        Initialize histogram
+        """
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Record an observed value with labels
+        """
+        key = _labels_key(labels)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # bucket counts, then sum and count
+                entry = [0] * (len(self.buckets) + 2)
+                self.values[key] = entry
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+        _maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration in seconds of the with block
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def dump(self):
+        with self._lock:
+            return [[dict(key), list(entry)] for key, entry in self.values.items()]
+
+
+def _register(metric):
+    with _METRICS_LOCK:
+        return _METRICS.setdefault(metric.name, metric)
+
+
+def counter(name, documentation):
+    """
+    Return the process counter called name, creating it on first use
+    """
+    return _register(Counter(name, documentation))
+
+
+def histogram(name, documentation, buckets=LATENCY_BUCKETS):
+    """
+    Return the process histogram called name, creating it on first use
+    """
+    return _register(Histogram(name, documentation, buckets))
+
+
+SOLR_REQUEST_SECONDS = histogram(
+    "adc_solr_request_seconds", "Solr select round trip time, including decoding"
+)
+SOLR_NUM_FOUND = histogram(
+    "adc_solr_num_found", "Records matched by repository queries", COUNT_BUCKETS
+)
+QUERIES = counter("adc_repository_queries_total", "Repository queries by method")
+TRANSFORM_SECONDS = histogram(
+    "adc_transform_seconds", "Time to transform a batch of MMD records by schema"
+)
+TRANSFORM_RECORDS = counter(
+    "adc_transform_records_total", "MMD records transformed by schema"
+)
+TRANSFORM_ERRORS = counter("adc_transform_errors_total", "Failed transforms by schema")
+WRITE_SECONDS = histogram(
+    "adc_write_seconds", "Time to serialize records by output schema"
+)
+ERRORS = counter("adc_errors_total", "Errors by stage")
+CACHE_HITS = counter("adc_cache_hits_total", "Cache hits by cache")
+CACHE_MISSES = counter("adc_cache_misses_total", "Cache misses by cache")
+
+
+def configure_metrics(config):
+    """
+    Set up sharing of metrics between processes from the [repository]
+    section of config
+    """
+    global _DIRECTORY, _FLUSH_INTERVAL
+    directory = config.get("repository", "metrics_dir", fallback="") or None
+    if directory is not None and directory != _DIRECTORY:
+        os.makedirs(directory, exist_ok=True)
+    _DIRECTORY = directory
+    _FLUSH_INTERVAL = config.getfloat(
+        "repository", "metrics_flush_interval", fallback=5.0
+    )
+
+
+def _collect():
+    # cache counters are kept by the caches themselves
+    for name, stats in cache_stats().items():
+        CACHE_HITS.set(stats["hits"], cache=name)
+        CACHE_MISSES.set(stats["misses"], cache=name)
+
+
+def dump():
+    """
+    Return the metrics of the process as JSON serializable dict
+    """
+    _collect()
+    with _METRICS_LOCK:
+        metrics = list(_METRICS.values())
+    return {
+        metric.name: {
+            "kind": metric.kind,
+            "documentation": metric.documentation,
+            "buckets": getattr(metric, "buckets", None),
+            "values": metric.dump(),
+        }
+        for metric in metrics
+    }
+
+
+def flush():
+    """
+    Write the metrics of the process to the metrics directory
+    """
+    global _FLUSHED
+    directory = _DIRECTORY
+    if directory is None or not _RECORDED:
+        return
+    _FLUSHED = time.monotonic()
+    try:
+        _write(directory, "%d.json" % os.getpid(), dump())
+    except OSError as err:
+        LOGGER.warning("Could not write metrics to %s: %s", directory, err)
+
+
+def _write(directory, name, metrics):
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as fh:
+            json.dump(metrics, fh)
+        os.replace(tmp, os.path.join(directory, name))
+    except OSError:
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _maybe_flush():
+    global _RECORDED
+    _RECORDED = True
+    if _DIRECTORY is not None and time.monotonic() - _FLUSHED > _FLUSH_INTERVAL:
+        flush()
+
+
+@contextmanager
+def _locked(directory, operation):
+    with open(os.path.join(directory, LOCK_FILE), "a") as fh:
+        fcntl.flock(fh, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _read(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _retire(directory, pid, metrics=None):
+    # add the metrics of an exited process (read from its file by default)
+    # to the retired metrics and remove its file, so that the merged
+    # counters keep counting what the process did
+    path = os.path.join(directory, "%d.json" % pid)
+    retired = os.path.join(directory, RETIRED_FILE)
+    try:
+        with _locked(directory, fcntl.LOCK_EX):
+            if metrics is None:
+                try:
+                    metrics = _read(path)
+                except FileNotFoundError:
+                    # retired meanwhile by another process
+                    return
+                except ValueError as err:
+                    LOGGER.warning("Dropping metrics file %s: %s", path, err)
+                    metrics = {}
+            dumps = [metrics]
+            if os.path.exists(retired):
+                dumps.append(_read(retired))
+            _write(directory, RETIRED_FILE, _dump(_merge(dumps)))
+            if os.path.exists(path):
+                os.remove(path)
+    except (OSError, ValueError) as err:
+        LOGGER.warning("Could not retire metrics of process %d: %s", pid, err)
+
+
+def _exit():
+    directory = _DIRECTORY
+    if directory is not None and _RECORDED:
+        _retire(directory, os.getpid(), dump())
+
+
+atexit.register(_exit)
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # process of another user
+        return True
+    return True
+
+
+def _load(directory):
+    # metric dumps of the other running processes sharing directory and the
+    # retired metrics of the exited ones
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name.isdigit() and not _running(int(name)):
+            LOGGER.debug("Retiring metrics file of exited process %s", path)
+            _retire(directory, int(name))
+
+    dumps = []
+    with _locked(directory, fcntl.LOCK_SH):
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            name = os.path.splitext(os.path.basename(path))[0]
+            if name.isdigit() and int(name) == os.getpid():
+                continue
+            try:
+                dumps.append(_read(path))
+            except (OSError, ValueError) as err:
+                LOGGER.warning("Skipping metrics file %s: %s", path, err)
+    return dumps
+
+
+def _merge(dumps):
+    merged = {}
+    for metrics in dumps:
+        for name, metric in metrics.items():
+            target = merged.setdefault(name, dict(metric, values={}))
+            for labels, value in metric["values"]:
+                key = _labels_key(labels)
+                if key not in target["values"]:
+                    target["values"][key] = value
+                elif metric["kind"] == "histogram":
+                    target["values"][key] = [
+                        a + b for a, b in zip(target["values"][key], value)
+                    ]
+                else:
+                    target["values"][key] += value
+    return merged
+
+
+def _dump(merged):
+    # merged metrics in the format of dump()
+    return {
+        name: dict(
+            metric,
+            values=[[dict(key), value] for key, value in metric["values"].items()],
+        )
+        for name, metric in merged.items()
+    }
+
+
+def _format_labels(key, extra=()):
+    labels = list(key) + list(extra)
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"'
+        % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels
+    )
+
+
+def exposition():
+    """
+    Return the metrics of all worker processes (or of this process, without
+    metrics_dir) in the Prometheus text exposition format
+    """
+    dumps = [dump()]
+    if _DIRECTORY is not None:
+        dumps.extend(_load(_DIRECTORY))
+    metrics = _merge(dumps)
+
+    lines = []
+    for name in sorted(metrics):
+        metric = metrics[name]
+        lines.append("# HELP %s %s" % (name, metric["documentation"]))
+        lines.append("# TYPE %s %s" % (name, metric["kind"]))
+        for key, value in sorted(metric["values"].items()):
+            if metric["kind"] != "histogram":
+                lines.append("%s%s %s" % (name, _format_labels(key), value))
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], value):
+                cumulative += count
+                lines.append(
+                    "%s_bucket%s %d"
+                    % (name, _format_labels(key, [("le", bound)]), cumulative)
+                )
+            lines.append(
+                "%s_bucket%s %d"
+                % (name, _format_labels(key, [("le", "+Inf")]), value[-1])
+            )
+            lines.append("%s_sum%s %s" % (name, _format_labels(key), value[-2]))
+            lines.append("%s_count%s %d" % (name, _format_labels(key), value[-1]))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware(object):
+    """
+    WSGI middleware serving the metrics exposition on path, passing all
+    other requests to the wrapped application
+    """
+
+    def __init__(self, app, path="/metrics"):
+        """
+        Initialize middleware
+        """
+        self.app = app
+        self.path = path
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") != self.path:
+            return self.app(environ, start_response)
+
+        body = exposition().encode("utf-8")
+        start_response(
+            "200 OK",
+            [("Content-Type", CONTENT_TYPE), ("Content-Length", str(len(body)))],
+        )
+        return [body]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the metrics exposition")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    from pycsw.plugins.repository.solr_helper import get_config
+
+    configure_metrics(get_config())
+    text = exposition()
+    if args.output is None:
+        sys.stdout.write(text)
+        return 0
+
+    directory = os.path.dirname(os.path.abspath(args.output))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        fh.write(text)
+    os.replace(tmp, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
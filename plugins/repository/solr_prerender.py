@@ -0,0 +1,188 @@
+"""
+Pre-render the configured output schemas of every Active record into the
+rendition store, e.g. nightly and after large ingests:
+
+    PYCSW_CONFIG=default.cfg python -m pycsw.plugins.repository.solr_prerender
+
+Records are streamed from Solr with cursor paging and rendered by a pool of
+worker processes. The newest record timestamp seen is kept in the store, so
+later runs only render records indexed since the previous run.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+from pycsw.core.config import StaticContext
+from pycsw.plugins.repository.solr_filter import render_filter
+from pycsw.plugins.repository.solr_helper import (
+    FULL_FIELDS,
+    format_solr_date,
+    get_config,
+    get_iso_transformer,
+    get_rendition_store,
+    get_timestamp,
+    get_transform_executor,
+    parse_datetime,
+    render_records,
+)
+from pycsw.plugins.repository.solr_metno import SOLRMETNORepository
+
+LOGGER = logging.getLogger(__name__)
+
+SCHEMAS = ["iso", "dif", "dif10", "wmo"]
+STATE_FILE = ".prerender-timestamp"
+
+
+def get_stylesheets(schemas):
+    """
+    Return the configured stylesheet of each schema, keyed by schema
+    """
+    config = get_config()
+    stylesheets = {}
+    for schema in schemas:
+        if schema == "iso":
+            stylesheets[schema] = get_iso_transformer()
+        elif config.has_option("xslt", schema):
+            stylesheets[schema] = config.get("xslt", schema)
+        else:
+            LOGGER.warning("No stylesheet configured for %s, skipping", schema)
+    return stylesheets
+
+
+def read_state(store):
+    try:
+        with open(os.path.join(store.root, STATE_FILE), encoding="utf-8") as fh:
+            state = fh.read().strip()
+    except OSError:
+        return None
+    if not state:
+        return None
+    try:
+        datetime.strptime(state[:19], "%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        LOGGER.warning("Ignoring invalid state %r, rendering all records", state)
+        return None
+    return state
+
+
+def write_state(store, timestamp):
+    path = os.path.join(store.root, STATE_FILE)
+    with open("%s.tmp" % path, "w", encoding="utf-8") as fh:
+        fh.write(timestamp)
+    os.replace("%s.tmp" % path, path)
+
+
+def iter_pages(repository, rows, since=None):
+    """
+    Yield pages of Active record docs of the configured collections using
+    cursor paging, optionally only docs indexed after since
+    """
+    params = {
+        "q": "*:*",
+        "fq": [render_filter(repository._constant_filter())],
+        "fl": ",".join(FULL_FIELDS),
+        "sort": "metadata_identifier asc",
+        "rows": rows,
+        "cursorMark": "*",
+    }
+    if since is not None:
+        params["fq"].append("timestamp:{%s TO *]" % since)
+
+    while True:
+        response = repository.transport.select(params)
+        docs = response["response"]["docs"]
+        if docs:
+            yield docs
+        next_cursor_mark = response["nextCursorMark"]
+        if next_cursor_mark == params["cursorMark"]:
+            break
+        params = dict(params, cursorMark=next_cursor_mark)
+
+
+def prerender(schemas=SCHEMAS, rows=500, workers=None, full=False):
+    """
+    Render schemas for all (or only new) records into the rendition store
+    and return the number of records processed
+    """
+    store = get_rendition_store()
+    if store is None:
+        raise RuntimeError("No rendition_store configured in [repository]")
+
+    config = get_config()
+    repository = SOLRMETNORepository(
+        StaticContext(), config.get("repository", "filter")
+    )
+    stylesheets = get_stylesheets(schemas)
+    executor = get_transform_executor("process", workers or os.cpu_count() or 1)
+
+    since = None if full else read_state(store)
+    LOGGER.info("Rendering %s for records indexed after %s", list(stylesheets), since)
+
+    newest = since
+    newest_parsed = None if since is None else parse_datetime(since)
+    count = 0
+    start = time.monotonic()
+    for docs in iter_pages(repository, rows, since):
+        records = [repository._doc2record(doc) for doc in docs]
+        for xslt_file in stylesheets.values():
+            render_records(records, xslt_file, executor=executor)
+
+        count += len(records)
+        for doc in docs:
+            timestamp = get_timestamp(doc)
+            if timestamp is None:
+                continue
+            # compared as dates: string order puts ...00.5Z before ...00Z
+            parsed = parse_datetime(timestamp)
+            if newest_parsed is None or parsed > newest_parsed:
+                newest, newest_parsed = timestamp, parsed
+        elapsed = time.monotonic() - start
+        LOGGER.info("%d records, %.1f records/s", count, count / elapsed)
+
+    size = store.evict()
+    if size is not None:
+        LOGGER.info("Rendition store holds %d bytes", size)
+
+    if newest is not None:
+        # whole seconds: records of the same second are rendered again by the
+        # next run rather than skipped
+        write_state(store, format_solr_date(newest))
+
+    elapsed = time.monotonic() - start
+    print(
+        "Rendered %d records (%s) in %.1fs, %.1f records/s"
+        % (count, ", ".join(stylesheets), elapsed, count / elapsed if elapsed else 0)
+    )
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Pre-render records into the rendition store"
+    )
+    parser.add_argument(
+        "--schema",
+        action="append",
+        choices=SCHEMAS,
+        help="output schema to render (default: all configured)",
+    )
+    parser.add_argument("--rows", type=int, default=500, help="records per Solr page")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPUs)")
+    parser.add_argument(
+        "--full", action="store_true", help="render all records, not only new ones"
+    )
+    parser.add_argument("--verbose", action="store_true", help="log progress")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    prerender(args.schema or SCHEMAS, args.rows, args.workers, args.full)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Tracing of the request stages of the Solr repository and its outputs.
+
+Stages are timed with span(name). When the OpenTelemetry API is installed,
+spans are also reported to the configured tracer provider; otherwise they
+are no-ops. While a request is timed (timed_request, ServerTimingMiddleware)
+the durations of its stages are summed per stage name for a Server-Timing
+header.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+LOGGER = logging.getLogger(__name__)
+
+_TRACER = trace.get_tracer(__name__) if trace is not None else None
+
+# stage timings of the request being served in the current context
+_TIMINGS = contextvars.ContextVar("solr_timings", default=None)
+
+
+class _NoopSpan(object):
+    """
+    Span of the no-op tracer
+    """
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def record_exception(self, exception, attributes=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Timings(object):
+    """
+    Durations in milliseconds of the stages of one request, summed per
+    stage name
+    """
+
+    def __init__(self):
+        """
+        Initialize timings
+        """
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        """
+        Add duration (ms) to stage name
+        """
+        with self._lock:
+            total, count = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + duration, count + 1)
+
+    def header(self):
+        """
+        Return the timings as Server-Timing header value
+        """
+        with self._lock:
+            stages = list(self.stages.items())
+        return ", ".join(
+            '%s;dur=%.1f;desc="%d calls"' % (name, total, count)
+            if count > 1
+            else "%s;dur=%.1f" % (name, total)
+            for name, (total, count) in stages
+        )
+
+
+@contextmanager
+def span(name, attributes=None):
+    """
+    Time a stage of the current request. Yields the OpenTelemetry span,
+    or a no-op span with the same attribute API.
+    """
+    timings = _TIMINGS.get()
+    if _TRACER is None and timings is None:
+        yield NOOP_SPAN
+        return
+
+    start = time.perf_counter()
+    try:
+        if _TRACER is None:
+            yield NOOP_SPAN
+        else:
+            with _TRACER.start_as_current_span(name, attributes=attributes) as current:
+                yield current
+    finally:
+        if timings is not None:
+            timings.add(name, (time.perf_counter() - start) * 1000)
+
+
+def record(name, duration):
+    """
+    Add a duration (ms) measured elsewhere, e.g. Solr QTime, to stage name
+    of the current request
+    """
+    timings = _TIMINGS.get()
+    if timings is not None:
+        timings.add(name, duration)
+
+
+@contextmanager
+def timed_request():
+    """
+    Collect the stage timings of the spans run in the current context.
+    Yields the Timings.
+    """
+    timings = Timings()
+    token = _TIMINGS.set(timings)
+    try:
+        yield timings
+    finally:
+        _TIMINGS.reset(token)
+
+
+class ServerTimingMiddleware(object):
+    """
+    WSGI middleware adding a Server-Timing header with the stage timings of
+    the request to the response of the wrapped application
+    """
+
+    def __init__(self, app):
+        """
+        Initialize middleware
+        """
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        with timed_request() as timings:
+
+            def timing_start_response(status, headers, exc_info=None):
+                header = timings.header()
+                if header:
+                    LOGGER.debug("Server-Timing: %s", header)
+                    headers = list(headers) + [("Server-Timing", header)]
+                return start_response(status, headers, exc_info)
+
+            return self.app(environ, timing_start_response)
@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pycsw.plugins.repository.solr_cache import SingleFlight, params_key
+from pycsw.plugins.repository.solr_metrics import ERRORS, SOLR_REQUEST_SECONDS
+from pycsw.plugins.repository.solr_trace import record, span
+
+LOGGER = logging.getLogger(__name__)
+
+# one transport per (process, Solr core), shared by all repository objects
+_TRANSPORTS = {}
+_TRANSPORTS_LOCK = threading.Lock()
+
+
+class SolrTransport(object):
+    """
+    Pooled keep-alive HTTP transport to a Solr core
+    """
+
+    def __init__(
+        self,
+        base_url,
+        pool_size=10,
+        connect_timeout=5.0,
+        read_timeout=30.0,
+        post_threshold=2000,
+        coalesce=True,
+    ):
+        """
+        Initialize transport
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.post_threshold = post_threshold
+        # identical concurrent selects share one upstream request
+        self.inflight = SingleFlight() if coalesce else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def select(self, params):
+        """
+        Run a select request and return the decoded JSON response.
+        Concurrent identical requests are coalesced into one upstream
+        call; the shared response must not be modified.
+        """
+        if self.inflight is None:
+            return self._select(params)
+        return self.inflight.do(params_key(params), self._select, params)
+
+    def _select(self, params):
+        """
+        Send a select request. Parameter sets longer than post_threshold
+        are sent as a POST body so long ID lists and polygons do not hit
+        URL length limits.
+        """
+        url = "%s/select" % self.base_url
+        start = time.perf_counter()
+
+        try:
+            with span("solr.http", {"url": url}):
+                if len(urlencode(params, doseq=True)) > self.post_threshold:
+                    response = self.session.post(
+                        url, data=params, timeout=self.timeout
+                    )
+                else:
+                    response = self.session.get(
+                        url, params=params, timeout=self.timeout
+                    )
+                response.raise_for_status()
+
+            with span("solr.json"):
+                result = response.json()
+        except Exception:
+            ERRORS.inc(stage="solr")
+            raise
+
+        SOLR_REQUEST_SECONDS.observe(time.perf_counter() - start)
+
+        # time spent by Solr itself, the rest of solr.http is network
+        qtime = result.get("responseHeader", {}).get("QTime")
+        if qtime is not None:
+            record("solr.qtime", qtime)
+
+        return result
+
+
+def get_transport(base_url, config=None):
+    """
+    Return the process-wide transport for base_url, creating it from the
+    [repository] section of config on first use
+    """
+    key = (os.getpid(), base_url)
+
+    with _TRANSPORTS_LOCK:
+        transport = _TRANSPORTS.get(key)
+        if transport is None:
+            options = {}
+            if config is not None:
+                options = {
+                    "pool_size": config.getint(
+                        "repository", "solr_pool_size", fallback=10
+                    ),
+                    "connect_timeout": config.getfloat(
+                        "repository", "solr_connect_timeout", fallback=5.0
+                    ),
+                    "read_timeout": config.getfloat(
+                        "repository", "solr_read_timeout", fallback=30.0
+                    ),
+                    "post_threshold": config.getint(
+                        "repository", "solr_post_threshold", fallback=2000
+                    ),
+                    "coalesce": config.getboolean(
+                        "repository", "solr_coalesce_requests", fallback=True
+                    ),
+                }
+            LOGGER.debug("Creating Solr transport for %s: %s", base_url, options)
+            transport = SolrTransport(base_url, **options)
+            _TRANSPORTS[key] = transport
+
+    return transport
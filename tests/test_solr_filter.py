@@ -0,0 +1,317 @@
+"""
+Tests of the OGC filter to Solr query compiler
+"""
+
+import pytest
+
+from pycsw.plugins.repository.solr_filter import (
+    And,
+    FullText,
+    MatchNone,
+    Not,
+    Or,
+    Pattern,
+    Range,
+    Term,
+    compile_filter,
+    emit,
+    parse_filter,
+    render_filter,
+)
+
+
+def comparison(operator, name, literal, **attributes):
+    operand = {"ogc:PropertyName": name, "ogc:Literal": literal}
+    operand.update(("@%s" % key, value) for key, value in attributes.items())
+    return {"ogc:%s" % operator: operand}
+
+
+def compile_one(node):
+    return compile_filter({"ogc:Filter": node})
+
+
+def fq(node):
+    compiled = compile_one(node)
+    assert compiled.q == "*:*"
+    assert len(compiled.filters) == 1
+    return compiled.filters[0].query
+
+
+def test_equal_to_exact_field():
+    node = comparison("PropertyIsEqualTo", "dc:identifier", "no.met:abc")
+    assert fq(node) == 'metadata_identifier:"no.met:abc"'
+
+
+def test_equal_to_text_field():
+    node = comparison("PropertyIsEqualTo", "dc:title", "sea ice")
+    assert fq(node) == "title:(sea ice)"
+
+
+def test_equal_to_multiple_fields():
+    node = comparison("PropertyIsEqualTo", "dc:contributor", "Doe")
+    assert fq(node) == (
+        "(personnel_technical_name:(Doe) OR personnel_metadata_author_name:(Doe))"
+    )
+
+
+def test_not_equal_to():
+    node = comparison("PropertyIsNotEqualTo", "dc:subject", "ice")
+    assert fq(node) == "(*:* -keywords_keyword:(ice))"
+
+
+def test_equal_to_date_field():
+    node = comparison("PropertyIsEqualTo", "dct:modified", "2020-01-01")
+    assert fq(node) == 'last_metadata_update_datetime:"2020-01-01T00:00:00Z"'
+
+
+def test_equal_to_type():
+    assert fq(comparison("PropertyIsEqualTo", "dc:type", "dataset")) == (
+        'isParent:"false"'
+    )
+    assert fq(comparison("PropertyIsEqualTo", "dc:type", "series")) == (
+        'isParent:"true"'
+    )
+    assert fq(comparison("PropertyIsEqualTo", "dc:type", "service")) == "(*:* -*:*)"
+
+
+@pytest.mark.parametrize(
+    "operator, expected",
+    [
+        (
+            "PropertyIsLessThan",
+            'temporal_extent_end_date:[* TO "2020-01-01T00:00:00Z"}',
+        ),
+        (
+            "PropertyIsLessThanOrEqualTo",
+            'temporal_extent_end_date:[* TO "2020-01-01T00:00:00Z"]',
+        ),
+        (
+            "PropertyIsGreaterThan",
+            'temporal_extent_start_date:{"2020-01-01T00:00:00Z" TO *]',
+        ),
+        (
+            "PropertyIsGreaterThanOrEqualTo",
+            'temporal_extent_start_date:["2020-01-01T00:00:00Z" TO *]',
+        ),
+    ],
+)
+def test_comparison_on_unmapped_property(operator, expected):
+    assert fq(comparison(operator, "apiso:TempExtent", "2020-01-01")) == expected
+
+
+def test_comparison_on_mapped_date():
+    node = comparison("PropertyIsGreaterThan", "apiso:TempExtent_begin", "2020-01-01")
+    assert fq(node) == 'temporal_extent_start_date:{"2020-01-01T00:00:00Z" TO *]'
+
+
+def test_comparison_quotes_text_bound():
+    node = comparison("PropertyIsGreaterThan", "dc:title", "sea ice")
+    assert fq(node) == 'title:{"sea ice" TO *]'
+
+
+def test_between():
+    node = {
+        "ogc:PropertyIsBetween": {
+            "ogc:PropertyName": "dct:modified",
+            "ogc:LowerBoundary": {"ogc:Literal": "2020-01-01"},
+            "ogc:UpperBoundary": {"ogc:Literal": "2020-12-31T12:00:00Z"},
+        }
+    }
+    assert fq(node) == (
+        "last_metadata_update_datetime:"
+        '["2020-01-01T00:00:00Z" TO "2020-12-31T12:00:00Z"]'
+    )
+
+
+def test_is_null():
+    node = {"ogc:PropertyIsNull": {"ogc:PropertyName": "dc:title"}}
+    assert fq(node) == "(*:* -title:[* TO *])"
+
+
+def test_like():
+    node = comparison(
+        "PropertyIsLike", "dc:title", "%sea_ice%", wildCard="%", singleChar="_"
+    )
+    assert fq(node) == "title:(*sea?ice*)"
+
+
+def test_like_escape_char():
+    node = comparison(
+        "PropertyIsLike",
+        "dc:title",
+        "100!% ice%",
+        wildCard="%",
+        singleChar="_",
+        escapeChar="!",
+    )
+    assert fq(node) == "title:(100% ice*)"
+
+
+def test_like_escapes_literal_syntax():
+    node = comparison(
+        "PropertyIsLike", "dc:title", "a*b (c)%", wildCard="%", singleChar="_"
+    )
+    assert fq(node) == r"title:(a\*b \(c\)*)"
+
+
+def test_like_on_exact_field():
+    node = comparison(
+        "PropertyIsLike", "dc:identifier", "no.met:%", wildCard="%", singleChar="_"
+    )
+    assert fq(node) == r"metadata_identifier:(no.met\:*)"
+
+
+def test_anytext_goes_to_q():
+    compiled = compile_one(comparison("PropertyIsEqualTo", "csw:AnyText", "ice"))
+    assert compiled.q == "full_text:(ice)"
+    assert compiled.filters == ()
+
+
+def test_anytext_like():
+    node = comparison(
+        "PropertyIsLike", "csw:AnyText", "%ice%", wildCard="%", singleChar="_"
+    )
+    assert compile_one(node).q == "full_text:(*ice*)"
+
+
+def test_bbox():
+    node = {
+        "ogc:BBOX": {
+            "ogc:PropertyName": "ows:BoundingBox",
+            "gml:Envelope": {
+                "gml:lowerCorner": "60 -10",
+                "gml:upperCorner": "80 30",
+            },
+        }
+    }
+    planned = compile_one(node).filters[0]
+    assert planned.query == "Within(ENVELOPE(60.0,80.0,30.0,-10.0))"
+    assert render_filter(planned) == (
+        "{!field f=bbox score=overlapRatio cache=false cost=100}"
+        "Within(ENVELOPE(60.0,80.0,30.0,-10.0))"
+    )
+
+
+def test_unsupported_operator():
+    with pytest.raises(NotImplementedError):
+        compile_one({"ogc:PropertyIsFoo": {"ogc:PropertyName": "dc:title"}})
+
+
+def test_unsupported_queryable():
+    with pytest.raises(NotImplementedError):
+        compile_one(comparison("PropertyIsEqualTo", "dc:foo", "bar"))
+
+
+@pytest.mark.parametrize(
+    "literal, expected",
+    [
+        ("a) OR (*:*", r"keywords_keyword:(a\) \OR \(\*\:\*)"),
+        ('ice" OR "x', r'keywords_keyword:(ice\" \OR \"x)'),
+        ("a AND b NOT c", r"keywords_keyword:(a \AND b \NOT c)"),
+        ("+ice -sea", r"keywords_keyword:(\+ice \-sea)"),
+        ("a && b || c", r"keywords_keyword:(a \&\& b \|\| c)"),
+        (
+            "x^2 ~y [z] {w} !v /u/ \\t",
+            r"keywords_keyword:(x\^2 \~y \[z\] \{w\} \!v \/u\/ \\t)",
+        ),
+        ("", 'keywords_keyword:("")'),
+    ],
+)
+def test_escaping(literal, expected):
+    assert fq(comparison("PropertyIsEqualTo", "dc:subject", literal)) == expected
+
+
+def test_escaping_exact_field():
+    node = comparison("PropertyIsEqualTo", "dc:identifier", 'a" OR "b')
+    assert fq(node) == r'metadata_identifier:"a\" OR \"b"'
+
+
+def test_escaping_fulltext():
+    node = comparison("PropertyIsEqualTo", "csw:AnyText", "a) OR (*:*")
+    assert compile_one(node).q == r"full_text:(a\) \OR \(\*\:\*)"
+
+
+def test_escaping_range_bound():
+    node = comparison("PropertyIsLessThan", "dc:title", 'x" TO *] OR title:["')
+    assert fq(node) == r'title:[* TO "x\" TO *] OR title:[\""}'
+
+
+def test_and_of_siblings_gives_filters():
+    node = {
+        "ogc:And": {
+            "ogc:PropertyIsEqualTo": [
+                {"ogc:PropertyName": "dc:title", "ogc:Literal": "ice"},
+                {"ogc:PropertyName": "dc:subject", "ogc:Literal": "sea"},
+            ]
+        }
+    }
+    compiled = compile_one(node)
+    assert [planned.query for planned in compiled.filters] == [
+        "title:(ice)",
+        "keywords_keyword:(sea)",
+    ]
+
+
+def test_nested_and_or_not():
+    node = {
+        "ogc:Or": {
+            "ogc:And": {
+                "ogc:PropertyIsEqualTo": {
+                    "ogc:PropertyName": "dc:title",
+                    "ogc:Literal": "ice",
+                },
+                "ogc:Not": {
+                    "ogc:PropertyIsEqualTo": {
+                        "ogc:PropertyName": "dc:subject",
+                        "ogc:Literal": "sea",
+                    }
+                },
+            },
+            "ogc:PropertyIsLike": {
+                "@wildCard": "%",
+                "@singleChar": "_",
+                "ogc:PropertyName": "dc:title",
+                "ogc:Literal": "snow%",
+            },
+        }
+    }
+    # operands come in the sorted order of the canonical filter
+    assert fq(node) == (
+        "(((*:* -keywords_keyword:(sea)) AND title:(ice)) OR title:(snow*))"
+    )
+
+
+def test_nested_or_with_anytext_goes_to_q():
+    node = {
+        "ogc:Or": {
+            "ogc:PropertyIsEqualTo": [
+                {"ogc:PropertyName": "csw:AnyText", "ogc:Literal": "ice"},
+                {"ogc:PropertyName": "dc:title", "ogc:Literal": "sea"},
+            ]
+        }
+    }
+    compiled = compile_one(node)
+    assert compiled.q == "(full_text:(ice) OR title:(sea))"
+    assert compiled.filters == ()
+
+
+def test_parse_filter():
+    tree = parse_filter(
+        {
+            "ogc:Not": {
+                "ogc:PropertyIsLike": {
+                    "@wildCard": "%",
+                    "ogc:PropertyName": "csw:AnyText",
+                    "ogc:Literal": "ice%",
+                }
+            }
+        }
+    )
+    assert tree == And((Not(FullText(Pattern("ice*"))),))
+
+
+def test_emit_nodes():
+    assert emit(Or((Term("title", "a", False), MatchNone()))) == (
+        "(title:(a) OR (*:* -*:*))"
+    )
+    assert emit(Range("title", "a b", "*", True, False)) == 'title:["a b" TO *}'
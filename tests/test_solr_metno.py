@@ -0,0 +1,218 @@
+"""
+Tests of the Solr repository
+"""
+
+import base64
+import configparser
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from pycsw.plugins.repository import solr_cache, solr_metno
+from pycsw.plugins.repository.solr_metno import SOLRMETNORepository
+
+
+class FakeTransport(object):
+    """
+    Transport answering selects with the page of docs asked for by start
+    and rows
+    """
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.params = []
+
+    def select(self, params):
+        self.params.append(dict(params))
+        start = params.get("start", 0)
+        docs = self.docs[start : start + params.get("rows", 10)]
+        return {"response": {"numFound": len(self.docs), "start": start, "docs": docs}}
+
+
+def make_doc(i):
+    return {
+        "metadata_identifier": "no.met:%d" % i,
+        "title": ["Dataset %d" % i],
+        "bbox": "ENVELOPE(-10, 30, 80, 60)",
+    }
+
+
+def make_repository(docs):
+    # no configuration needed: skip __init__
+    repository = SOLRMETNORepository.__new__(SOLRMETNORepository)
+    repository.filter = "http://localhost:8983/solr/mmd"
+    repository.solr_select_url = "%s/select" % repository.filter
+    repository.context = SimpleNamespace(parser=None)
+    repository.adc_collection_filter = "ADC NBS"
+    repository.transport = FakeTransport(docs)
+    return repository
+
+
+@pytest.fixture
+def config(monkeypatch):
+    """
+    [repository] configuration seen by the repository, with empty
+    process-wide caches
+    """
+    parser = configparser.ConfigParser()
+    parser.add_section("repository")
+    monkeypatch.setattr(solr_metno, "get_config", lambda: parser)
+    monkeypatch.setattr(solr_cache, "_CACHES", {})
+    monkeypatch.setattr(solr_metno, "_FETCHES", solr_cache.SingleFlight())
+    monkeypatch.setattr(solr_metno, "_PREFETCHES", {})
+    return parser["repository"]
+
+
+def test_query_insert_list_timestamp():
+    # shape of the docs of the MMD Solr core, see benchmarks/common.make_doc
+    repository = make_repository(
+        [{"metadata_identifier": "a", "timestamp": ["2022-05-04T10:11:12.123Z"]}]
+    )
+    assert repository.query_insert() == "2022-05-04T10:11:12Z"
+    params = repository.transport.params[0]
+    assert params["sort"] == "timestamp desc"
+    assert params["rows"] == 1
+
+
+def test_query_insert_scalar_timestamp():
+    repository = make_repository([{"timestamp": "2022-05-04T12:11:12+02:00"}])
+    assert repository.query_insert("min") == "2022-05-04T10:11:12Z"
+    assert repository.transport.params[0]["sort"] == "timestamp asc"
+
+
+def test_query_insert_empty_repository():
+    assert make_repository([]).query_insert() is None
+
+
+def test_query_streams_string_maxrecords(config):
+    # pycsw passes maxRecords as a string
+    config["stream_chunk_size"] = "2"
+    repository = make_repository([make_doc(i) for i in range(7)])
+    total, results = repository.query({}, maxrecords="5", startposition="1")
+    assert total == "7"
+    assert len(results) == 5
+    assert [record.identifier for record in results] == [
+        "no.met:%d" % i for i in range(1, 6)
+    ]
+    assert [(p["start"], p["rows"]) for p in repository.transport.params] == [
+        (1, 2),
+        (3, 2),
+        (5, 1),
+    ]
+
+
+@pytest.mark.parametrize(
+    "timestamp", ["2022-05-04T10:11:12Z", ["2022-05-04T10:11:12Z"]]
+)
+def test_doc2record_insert_date(timestamp):
+    doc = dict(make_doc(1), timestamp=timestamp)
+    record = make_repository([])._doc2record(doc)
+    assert record.insert_date == "2022-05-04T10:11:12+00:00"
+
+
+@pytest.mark.parametrize(
+    "maxrecords, resulttype", [("0", None), (0, None), ("10", "hits")]
+)
+def test_query_count_only(config, maxrecords, resulttype):
+    repository = make_repository([make_doc(i) for i in range(3)])
+    for _ in range(2):
+        total, results = repository.query(
+            {}, maxrecords=maxrecords, resulttype=resulttype
+        )
+        assert (total, results) == ("3", [])
+    # one rows=0 select, the second count came from the count cache
+    assert [p["rows"] for p in repository.transport.params] == [0]
+
+
+def test_query_result_cache_builds_fresh_records(config):
+    config["result_cache"] = "true"
+    docs = [make_doc(i) for i in range(3)]
+    for doc in docs:
+        doc["timestamp"] = ["2022-05-04T10:11:12Z"]
+        doc["mmd_xml_file"] = base64.b64encode(b"<mmd/>").decode()
+    repository = make_repository(docs)
+
+    _, first = repository.query({}, maxrecords="3")
+    result_cache = solr_cache.get_cache("result")
+    size = result_cache.stats()["bytes"]
+    assert size > 0
+    # parsing the MMD of served records does not change the cached page
+    assert [record.mmd_tree.tag for record in first] == ["mmd"] * 3
+
+    _, second = repository.query({}, maxrecords="3")
+    assert result_cache.stats()["hits"] == 1
+    assert result_cache.stats()["bytes"] == size
+    assert [record.identifier for record in second] == [
+        record.identifier for record in first
+    ]
+    assert all(record._mmd_tree is None for record in second)
+    # one select for the index version, one for the page
+    assert [p["fl"] for p in repository.transport.params].count("timestamp") == 1
+    assert len(repository.transport.params) == 2
+
+
+def wait_for_prefetches():
+    for future, _ in list(solr_metno._PREFETCHES.values()):
+        future.result(timeout=5)
+
+
+def test_query_uses_prefetched_page(config):
+    config["prefetch"] = "true"
+    repository = make_repository([make_doc(i) for i in range(7)])
+    repository.query({}, maxrecords="2", startposition="0")
+    # the second page of the sequence prefetches the third
+    repository.query({}, maxrecords="2", startposition="2")
+    wait_for_prefetches()
+    assert [p["start"] for p in repository.transport.params] == [0, 2, 4]
+
+    total, results = repository.query({}, maxrecords="2", startposition="4")
+    assert total == "7"
+    assert [record.identifier for record in results] == ["no.met:4", "no.met:5"]
+    assert solr_cache.get_cache("prefetch").hits == 1
+    wait_for_prefetches()
+    # the third page was not fetched again, the fourth was prefetched
+    assert [p["start"] for p in repository.transport.params] == [0, 2, 4, 6]
+
+
+def test_query_does_not_prefetch_random_access(config):
+    config["prefetch"] = "true"
+    repository = make_repository([make_doc(i) for i in range(7)])
+    repository.query({}, maxrecords="2", startposition="0")
+    repository.query({}, maxrecords="2", startposition="4")
+    wait_for_prefetches()
+    assert [p["start"] for p in repository.transport.params] == [0, 4]
+
+
+def test_concurrent_queries_share_one_fetch(config):
+    entered = threading.Event()
+    release = threading.Event()
+    repository = make_repository([make_doc(i) for i in range(3)])
+    select = repository.transport.select
+
+    def blocking_select(params):
+        entered.set()
+        release.wait(5)
+        return select(params)
+
+    repository.transport.select = blocking_select
+    results = []
+
+    def query():
+        results.append(repository.query({}, maxrecords="3"))
+
+    threads = [threading.Thread(target=query) for _ in range(2)]
+    threads[0].start()
+    assert entered.wait(5)
+    threads[1].start()
+    deadline = time.monotonic() + 5
+    while solr_metno._FETCHES.shared < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(repository.transport.params) == 1
+    assert results[0] == results[1]
+    assert len(results[0][1]) == 3